@@ -1,30 +1,27 @@
 import streamlit as st
 #IGDB modules
-from igdb.wrapper import IGDBWrapper
-from igdb_authentication import authenticate_twitch, get_token
-from igdb_api import IGBDAPI
+from igdb_authentication import token_manager
+from igdb_api import default_client
 from igdb_utilities import prompt_multiple_results, clean_game_info, clean_company_info
 #Gamespot modules
 from gamespot_api import GamespotAPI
 from gamespot_utilities import clean_game_review
+from game_page import get_game_page
+from igdb_lucky import LuckySearch
+from igdb_mirror import IGDBMirror, MirroredIGBDAPI
+from title_index import get_mirror_title_index
+from igdb_taxonomy import snapshot as taxonomy_snapshot
 import pandas as pd
 import os
 import sys
 import inspect
-import json
 from time import mktime
 from datetime import datetime
 
-with open('credentials/twitch_credentials.json', 'r') as f:
-    twitch_expiry_days = json.load(f)['expires_in']/(3600*24)
-    f.close()
-
-credentials_updated = os.path.getmtime('credentials/twitch_credentials.json')
-
-if (datetime.now().timestamp() - credentials_updated)/(3600*24) > twitch_expiry_days-1: #re-authenticating twich if close to expiry/has expired
-    authenticate_twitch()
-    st.stop()
-    st.error('Wait for developer to update IGDB credentials.')
+#Twitch token is kept in memory and refreshed in the background before it expires
+token_manager().start()
+#Genres, game modes and platforms come from the shared on-disk snapshot, refreshed in the background
+taxonomy_snapshot.start()
 
 app_mode_environment = os.environ.get('GAME_APP_MODE')
 app_mode = 'test' if not app_mode_environment else app_mode_environment
@@ -33,78 +30,62 @@ app_mode = 'test' if not app_mode_environment else app_mode_environment
 ### FUNCTIONS ###
 #################
 
-#@st.cache(allow_output_mutation=True)
+@st.cache(show_spinner=False, allow_output_mutation=True)
 def _igdb():
-    wrapper = IGDBWrapper(os.environ.get('TWITCH_ID'), get_token())
-    return IGBDAPI(wrapper)
-
-#@st.cache(show_spinner=False)
+    #Single client per process; it picks up refreshed tokens from the token manager
+    igdb = default_client()
+    #Reads are served from the local catalog mirror when one is configured (synced with `python igdb_mirror.py`)
+    mirror_path = os.environ.get('IGDB_MIRROR_PATH')
+    if mirror_path and os.path.exists(mirror_path):
+        return MirroredIGBDAPI(IGDBMirror(mirror_path), live=igdb)
+    return igdb
+
+@st.cache(show_spinner=False, allow_output_mutation=True)
 def _gamespot():
     return GamespotAPI(os.environ.get('GAMESPOT_API_KEY'), user_agent='pana$onic game hub')
 
 @st.cache(allow_output_mutation=True)
 def search(input, name_or_id='name', approximate=True):
     igdb = _igdb()
+    #With a local catalog mirror, approximate title search runs against its in-process title index
+    if approximate and name_or_id == 'name' and isinstance(igdb, MirroredIGBDAPI):
+        matches = get_mirror_title_index(igdb.mirror).search(input, k=10)
+        if len(matches) > 1:
+            return [{'id': m.id, 'name': m.name} for m in matches]
+        elif len(matches) == 1:
+            return igdb.get_game_info(input=matches[0].id, name_or_id='id')
     raw_info = igdb.get_game_info(input=input, name_or_id=name_or_id, approximate_match=approximate)
     return raw_info
 
+@st.cache(show_spinner=False, allow_output_mutation=True)
+def _lucky_search_engine():
+    return LuckySearch(_igdb())
+
 def lucky_search(limit=1, **where_filters):
-    igdb = _igdb()
-    raw_info = igdb.get_lucky_game_info(limit, **where_filters)
+    lucky = _lucky_search_engine()
+    raw_info = lucky.lucky_game_info(limit, **where_filters)
     return raw_info
 
-@st.cache(show_spinner=False)
 def _genres():
-    igdb = _igdb()
-    return igdb.get_all_genres()
+    return taxonomy_snapshot.get('genres', _igdb())
 
-@st.cache(show_spinner=False)
 def _game_modes():
-    igdb = _igdb()
-    return igdb.get_all_game_modes()
+    return taxonomy_snapshot.get('game_modes', _igdb())
 
-@st.cache(show_spinner=False)
 def _platforms():
-    igdb = _igdb()
-    return igdb.get_all_platforms()
-
-@st.cache(show_spinner=False)
-def _involved_companies(game_id):
-    igdb = _igdb()
-    return igdb.get_involved_companies(game_id)
+    return taxonomy_snapshot.get('platforms', _igdb())
 
-@st.cache(show_spinner=False)
-def _company_games(company):
-    igdb = _igdb()
-    return igdb.get_company_games(company)
-
-@st.cache(show_spinner=False)
-def _multiplayer_modes(game_id):
-    igdb = _igdb()
-    return igdb.get_multiplayer_modes(game_id)
-
-@st.cache(show_spinner=False)
-def _get_image_url(id, endpoint='games', img_type='cover'):
-    igdb = _igdb()
-    return igdb.get_image_url(id, endpoint, img_type)
-
-@st.cache(show_spinner=False)
-def _get_game_video(id):
-    igdb = _igdb()
-    return igdb.get_game_video(id)
-
-@st.cache(show_spinner=False)
-def _game_review(game):
-    gamespot = _gamespot()
-    return gamespot.game_review(game)
+def _game_page(game_id, title):
+    #Not st.cache'd: a failed lookup would be cached with the page. Repeat lookups are served by the response caches
+    return get_game_page(_igdb(), _gamespot(), game_id, title)
 
 @st.cache(show_spinner=False)
 def _clean_game_info(info):
     return clean_game_info(info)
 
-@st.cache(show_spinner=False)
-def _clean_game_review(review):
-    return clean_game_review(review)
+def _clean_game_review(review, review_id, update_date):
+    #Cached by review id and update date in the response cache rather than by hashing the whole body
+    return clean_game_review(review, review_id, update_date)
 
 @st.cache(show_spinner=False)
 def _prompt_multiple_results(info):
@@ -237,8 +218,9 @@ try:
         data = _clean_game_info(raw_data[0])
         
         title, summary = ingress(data)
-        image_path = _get_image_url(data['id'], endpoint='games', img_type='cover')
-        game_video = _get_game_video(data['id'])
+        page = _game_page(data['id'], title)
+        image_path = page['image_url']
+        game_video = page['game_video']
         
         #Header markdown
         header = f'<div><img style="float:left;margin-right:10px;", src="{image_path}", class="img-fluid"/><h2>{title}</h2>'
@@ -255,6 +237,7 @@ try:
         col12, col22, col32 = st.beta_columns(3)
         col13, col23, col33 = st.beta_columns(3)
         remove_from_details = []
+        got_companies = False
         with col12:
             st.markdown('### Total rating')
             if 'total_rating' in data.keys():
@@ -269,12 +252,9 @@ try:
         with col22:
             st.markdown('### Companies')
             if 'id' in data.keys():
-                try:
-                    developers, publishers = _involved_companies(data['id'])
-                    got_companies = True
-                except:
-                    got_companies = False
+                got_companies = page['companies'] is not None
                 if got_companies:
+                    developers, publishers = page['companies']
                     devs_name = ', '.join(list(developers.values()))
                     pubs_name = ', '.join(list(publishers.values()))
                     devs_id = list(developers.keys())
@@ -322,7 +302,7 @@ try:
             st.video(game_video)
 
         #Reviews
-        review_data = _game_review(title)
+        review_data = page['review']
         if len(review_data['results']) > 0: 
             review_block = st.beta_container()
             with review_block:
@@ -338,13 +318,13 @@ try:
                 st.markdown(f'-**{review_author}** (Gamespot, {review_date})')
                 review_expander = st.beta_expander('Full review')
                 with review_expander:
-                    review_body = _clean_game_review(review_data['results'][0]['body'])
+                    review_body = _clean_game_review(review_data['results'][0]['body'], review_data['results'][0]['id'], review_data['results'][0]['update_date'])
                     st.markdown(review_body, unsafe_allow_html=True)
                 
         st.subheader('More info')
 
         #Expand for multiplayer modes
-        multi_modes = _multiplayer_modes(data['id'])
+        multi_modes = page['multiplayer_modes']
         print(multi_modes)
         if multi_modes:
             with st.beta_expander('Multiplayer modes'):
@@ -364,11 +344,10 @@ try:
 
         #Expand for other games by developer
         if got_companies:
-            for dev_id in devs_id:
-                dev_games = _company_games(dev_id)
-            for pub_id in pubs_id:
-                pub_games = _company_games(pub_id)
-            other_games = sorted(list(set(dev_games + pub_games) - {title}))
+            company_games = []
+            for company_id in devs_id + pubs_id:
+                company_games += page['company_games'].get(company_id, [])
+            other_games = sorted(list(set(company_games) - {title}))
             with st.beta_expander('Other games by this developer/publisher'):
                 for other_game in other_games:
                     st.markdown(f'* {other_game}')        
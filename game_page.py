@@ -0,0 +1,47 @@
+import os
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+_max_workers = int(os.environ.get('GAME_PAGE_WORKERS', 8))
+_executor = ThreadPoolExecutor(max_workers=_max_workers, thread_name_prefix='game_page')
+
+def _safe_call(function, default, *args):
+    try:
+        return function(*args)
+    except Exception:
+        traceback.print_exc()
+        return default
+
+def _submit(function, default, *args):
+    return _executor.submit(_safe_call, function, default, *args)
+
+def get_game_page(igdb, gamespot, game_id, title):
+    '''
+        Fetches everything the game detail page needs for one game, running the independent
+        IGDB and Gamespot lookups in parallel on a bounded, process-wide thread pool.
+
+        :igdb: instance of IGBDAPI
+        :gamespot: instance of GamespotAPI
+        :game_id: IGDB id of the game
+        :title: game title, used to look up the Gamespot review
+
+        returns a dict with keys image_url, game_video, companies, review, multiplayer_modes and company_games.
+        A lookup that fails gets an empty value, and companies is None if the involved companies could not be fetched.
+    '''
+    #Image, video, multiplayer modes and involved companies share one IGDB multiquery round trip
+    default_details = {'image_url': '', 'game_video': '', 'multiplayer_modes': {}, 'companies': None}
+    details = _submit(igdb.get_game_details, default_details, game_id)
+    review = _submit(gamespot.game_review, {'results': ''}, title)
+
+    #Other games by the developers/publishers depend on the involved companies, the review is already in flight
+    page = dict(details.result())
+    company_games = {}
+    if page['companies'] is not None:
+        developers, publishers = page['companies']
+        company_ids = set(developers.keys()) | set(publishers.keys())
+        company_games = _safe_call(igdb.get_companies_games, {}, company_ids)
+
+    page['review'] = review.result()
+    page['company_games'] = company_games
+    
+    return page
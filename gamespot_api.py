@@ -1,9 +1,29 @@
 import os
+import threading
 import requests
+from urllib.parse import urlencode, quote
+from concurrent.futures import ThreadPoolExecutor
 from ast import literal_eval
 import json
-from fuzzywuzzy import fuzz
+from fuzzywuzzy import fuzz, process
 from pprint import pprint
+from http_session import get_session
+from igdb_cache import get_default_cache, day
+from igdb_scheduler import RequestScheduler, INTERACTIVE, BACKGROUND
+
+_default_scheduler = None
+_default_scheduler_lock = threading.Lock()
+
+def get_default_scheduler():
+    '''
+        Returns the process-wide scheduler for Gamespot requests (1 request per second unless GAMESPOT_RATE says otherwise).
+    '''
+    global _default_scheduler
+    if _default_scheduler is None:
+        with _default_scheduler_lock:
+            if _default_scheduler is None:
+                _default_scheduler = RequestScheduler(rate=float(os.environ.get('GAMESPOT_RATE', 1)), burst=2, max_concurrent=4)
+    return _default_scheduler
 
 class GamespotAPI:
 
@@ -13,31 +33,45 @@ class GamespotAPI:
 
     _default_format = 'json'
     _possible_endpoints = ('games', 'releases', 'articles', 'image_galleries', 'reviews', 'videos', 'images', 'events')
+    _review_fields = 'id,title,deck,authors,good,bad,update_date,body'
+    _review_candidates = 10 #number of reviews matching the title filter that are scored
+    _review_match_score = 95 #minimum token set ratio between game and review title
+    _review_ttl = day
+    _max_page_size = 100
 
-    def __init__(self, api_key:str, user_agent:str):
+    def __init__(self, api_key:str, user_agent:str, session=None, cache=True, scheduler=None):
         '''
             :_api_key: key needed to access the api
             :user_agent: must be provided as identification; Gamespot does not accept default users, e.g. "PythonLib" etc.
+            :session: requests session to send calls through; defaults to the process-wide pooled session
+            :cache: True for the process-wide response cache, False/None for no caching, or an igdb_cache.ResponseCache
+            :scheduler: igdb_scheduler.RequestScheduler rate limiting the requests; defaults to the process-wide Gamespot scheduler
         '''
         self._api_key = api_key
         self.user_agent = user_agent
-
-    def fetch_data(self, url:str):
+        self.session = get_session() if session is None else session
+        self.cache = get_default_cache() if cache is True else (cache or None)
+        self.scheduler = get_default_scheduler() if scheduler is None else scheduler
+
+    def fetch_data(self, url:str, priority=INTERACTIVE):
+        headers = {'user-agent': self.user_agent}
+        #Scheduler errors (SchedulerQueueFull, TimeoutError) are raised to the caller: there is no response to fall back to
+        with self.scheduler.slot(priority):
+            try:
+                response = self.session.get(url, headers=headers)
+            except requests.exceptions.RequestException as e:
+                print('Error in request:', e)
+                return None
         try:
-            headers = {'user-agent': self.user_agent}
-            response = requests.get(url, headers=headers)
             return json.loads(response.content)
-        except requests.exceptions.RequestException as e:
-            print('Error in request:', e)
-        except Exception as e:
-            evaluation_error = True
-        if evaluation_error:
+        except Exception:
             print('Response format is not json/cannot be evaluated, returning as byte array')
             return response.content
             
-    def query_endpoint(self, endpoint:str, **kwargs):
+    def query_endpoint(self, endpoint:str, priority=INTERACTIVE, **kwargs):
         '''
             :endpoint: specifies api endoint, e.g "games"
+            :priority: scheduler priority class of the request, igdb_scheduler.INTERACTIVE or igdb_scheduler.BACKGROUND
             :kwargs: any one of format, field_list, filter, association, sort, offset, limit.
 
             returns response content in wanted format.
@@ -51,24 +85,101 @@ class GamespotAPI:
         url = f'https://www.gamespot.com/api/{endpoint}/?api_key={self._api_key}'
 
         if kwargs:
-            appendix = '&'.join([f'{key}={value.replace(" ", "%20")}' for key, value in kwargs.items()])
+            appendix = urlencode({key: str(value) for key, value in kwargs.items()}, quote_via=quote, safe=':,|')
             url += f'&{appendix}'
         
         print('=======')
         print(f'Sending following request:\n{url}')
         print('=======')
         
-        data = self.fetch_data(url)
+        data = self.fetch_data(url, priority)
 
         return data
 
+    def iter_endpoint(self, endpoint:str, page_size=100, offset=0, max_records=None, **kwargs):
+        '''
+            Yields the records of an endpoint across pages, fetching the next page while the caller consumes the current one.
+
+            :page_size: records per request (at most 100)
+            :offset: offset of the first record; to resume, pass the previous offset plus the number of records consumed
+            :max_records: stop after this many records
+            :kwargs: other query parameters, e.g. filter, sort, field_list
+
+            Requests are rate limited by the scheduler with background priority.
+
+            Example: for review in gs.iter_endpoint('reviews', sort='publish_date:asc', field_list='id,title'): ...
+        '''
+        page_size = min(page_size, self._max_page_size)
+        kwargs.setdefault('format', self._default_format)
+        executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='gamespot_prefetch')
+
+        def fetch(page_offset):
+            return self.query_endpoint(endpoint, priority=BACKGROUND, offset=page_offset, limit=page_size, **kwargs)
+
+        future = executor.submit(fetch, offset)
+        yielded = 0
+        try:
+            while future is not None:
+                data = future.result()
+                results = data.get('results', []) if isinstance(data, dict) else []
+                total = data.get('number_of_total_results') if isinstance(data, dict) else None
+                next_offset = offset + len(results)
+                more = len(results) == page_size and (total is None or next_offset < total) \
+                    and (max_records is None or yielded + len(results) < max_records)
+                future = executor.submit(fetch, next_offset) if more else None
+                for record in results:
+                    if max_records is not None and yielded >= max_records:
+                        return
+                    yield record
+                    yielded += 1
+                offset = next_offset
+        finally:
+            if future is not None:
+                future.cancel()
+            executor.shutdown(wait=False)
+
+    def _cached(self, namespace:str, key:str):
+        if self.cache is None:
+            return False, None
+        return self.cache.get(namespace, key)
+
+    def _set_cached(self, namespace:str, key:str, value):
+        if self.cache is not None:
+            self.cache.set(namespace, key, value, self._review_ttl)
+
+    def match_review(self, game:str):
+        '''
+            Scores the titles of a small page of reviews matching the game and returns the id of the best one,
+            or None if no title is similar enough. The chosen id is cached per normalized game title.
+        '''
+        title_key = ' '.join(game.casefold().split())
+        hit, review_id = self._cached('gamespot_review_id', title_key)
+        if hit:
+            return review_id
+
+        candidates = self.query_endpoint(endpoint='reviews', format=self._default_format, filter=f'title:{game}',
+            field_list='id,title', limit=str(self._review_candidates))
+        titles = {candidate['id']: candidate['title'] for candidate in candidates.get('results', [])}
+        review_id = None
+        if titles:
+            _, score, best_id = process.extractOne(game, titles, scorer=fuzz.token_set_ratio)
+            if score > self._review_match_score:
+                review_id = best_id
+        self._set_cached('gamespot_review_id', title_key, review_id)
+        return review_id
+
     def game_review(self, game:str):
-        review_data = self.query_endpoint(endpoint='reviews', format=self._default_format, filter=f'title:{game}')
-        if len(review_data['results']) > 0:
-            #print(fuzz.token_set_ratio(game, review_data['results'][0]['title']))
-            if fuzz.token_set_ratio(game, review_data['results'][0]['title']) > 95:
-                return review_data
-        return {'results': ''}
+        review_id = self.match_review(game)
+        if review_id is None:
+            return {'results': ''}
+        
+        hit, review_data = self._cached('gamespot_review', str(review_id))
+        if not hit:
+            review_data = self.query_endpoint(endpoint='reviews', format=self._default_format, filter=f'id:{review_id}', field_list=self._review_fields)
+            if len(review_data.get('results', [])) == 0:
+                return {'results': ''}
+            self._set_cached('gamespot_review', str(review_id), review_data)
+        return review_data
 
     def game_articles(self, game:str, limit='5'):
         article_data = self.query_endpoint(endpoint='articles', format=self._default_format, filter=f'title:{game}', sort='publish_date:desc', limit=limit)
@@ -1,20 +1,118 @@
-import re
+from html.parser import HTMLParser
+from igdb_cache import get_default_cache, day
 
-def clean_game_review(review:str):
-    video_pattern = r'(<div data-embed-type="video".*?</div>)'
-    review = re.sub(video_pattern, '', review)
-    review = review.replace('<a ', '<a target="_blank" ')
-    return review
+_review_cache_ttl = 30*day
+
+class ReviewSanitizer(HTMLParser):
+
+    '''
+        One-pass sanitizer for Gamespot review bodies: drops video embeds (<div data-embed-type="video"> including nested elements)
+        and opens links in a new tab. Everything else is passed through as written.
+    '''
+
+    def __init__(self):
+        super().__init__(convert_charrefs=False)
+        self._parts = []
+        self._skip_depth = 0 #depth of divs inside a video embed being dropped
+
+    def handle_starttag(self, tag, attrs):
+        if self._skip_depth:
+            if tag == 'div':
+                self._skip_depth += 1
+            return
+        if tag == 'div' and ('data-embed-type', 'video') in attrs:
+            self._skip_depth = 1
+            return
+        self._append_tag(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        if not self._skip_depth:
+            self._append_tag(tag)
+
+    def _append_tag(self, tag):
+        text = self.get_starttag_text()
+        if text.startswith('<a '):
+            text = '<a target="_blank" ' + text[3:]
+        self._parts.append(text)
+
+    def handle_endtag(self, tag):
+        if self._skip_depth:
+            if tag == 'div':
+                self._skip_depth -= 1
+            return
+        self._parts.append(f'</{tag}>')
+
+    def _append(self, text):
+        if not self._skip_depth:
+            self._parts.append(text)
+
+    def handle_data(self, data):
+        self._append(data)
+
+    def handle_entityref(self, name):
+        self._append(f'&{name};')
+
+    def handle_charref(self, name):
+        self._append(f'&#{name};')
+
+    def handle_comment(self, data):
+        self._append(f'<!--{data}-->')
+
+    def handle_decl(self, decl):
+        self._append(f'<!{decl}>')
+
+    def handle_pi(self, data):
+        self._append(f'<?{data}>')
+
+    def sanitize(self, chunk:str):
+        '''
+            Feeds a chunk of the review and returns the sanitized output available so far.
+        '''
+        self.feed(chunk)
+        output = ''.join(self._parts)
+        self._parts = []
+        return output
+
+    def flush(self):
+        self.close()
+        output = ''.join(self._parts)
+        self._parts = []
+        return output
+
+def sanitize_review_chunks(chunks):
+    '''
+        Streaming variant of clean_game_review: yields sanitized output for an iterable of review body chunks.
+    '''
+    sanitizer = ReviewSanitizer()
+    for chunk in chunks:
+        output = sanitizer.sanitize(chunk)
+        if output:
+            yield output
+    output = sanitizer.flush()
+    if output:
+        yield output
+
+def clean_game_review(review:str, review_id=None, update_date=None, cache=None):
+    '''
+        Sanitizes a review body. Given the review id (and update date), the result is cached so each review version is processed once.
+    '''
+    if review_id is None:
+        return ''.join(sanitize_review_chunks([review]))
+
+    cache = get_default_cache() if cache is None else cache
+    key = f'{review_id}:{update_date}'
+    hit, clean_review = cache.get('gamespot_review_body', key)
+    if not hit:
+        clean_review = ''.join(sanitize_review_chunks([review]))
+        cache.set('gamespot_review_body', key, clean_review, _review_cache_ttl)
+    return clean_review
 
 
 if __name__ == '__main__':
     from gamespot_api import GamespotAPI
     import os
     from pprint import pprint
-    import re
     gs = GamespotAPI(os.environ.get('GAMESPOT_API_KEY'), user_agent='dpollozhani')
     data = gs.game_review('Ori and the will of the wisps')
     review = data['results'][0]['body']
     print(clean_game_review(review))
-    
- 
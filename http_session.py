@@ -0,0 +1,36 @@
+import os
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+
+_default_pool_connections = int(os.environ.get('HTTP_POOL_CONNECTIONS', 10)) #number of hosts kept in the pool
+_default_pool_maxsize = int(os.environ.get('HTTP_POOL_MAXSIZE', 20)) #open connections kept per host
+
+_session = None
+_session_lock = threading.Lock()
+
+def create_session(pool_connections=_default_pool_connections, pool_maxsize=_default_pool_maxsize):
+    '''
+        Creates a requests session with a keep-alive connection pool.
+
+        :pool_connections: number of hosts to keep connection pools for
+        :pool_maxsize: maximum number of connections kept open per host
+    '''
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, pool_block=False)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers.update({'Connection': 'keep-alive'})
+    return session
+
+def get_session():
+    '''
+        Returns the process-wide session shared by the IGDB and Gamespot clients, so that
+        connections (and their TLS handshakes) are reused across calls and page renders.
+    '''
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = create_session()
+    return _session
@@ -1,10 +1,19 @@
-from igdb_authentication import get_token
+from igdb_authentication import get_token, token_manager
 from igdb.wrapper import IGDBWrapper
 import igdb_utilities
+from http_session import get_session
+from igdb_cache import get_default_cache, normalize_query, endpoint_ttl
+from video_validation import validate_video
+from igdb_scheduler import get_default_scheduler, INTERACTIVE, BACKGROUND
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
 import json
 from ast import literal_eval
 import requests
 import random 
+import time
+from datetime import timezone
+from email.utils import parsedate_to_datetime
 
 import os
 import sys
@@ -12,35 +21,135 @@ import inspect
 
 class IGBDAPI():
 
-    def __init__(self, wrapper):
+    _multiquery_limit = 10 #maximum number of sub-queries IGDB accepts in one multiquery
+    _max_retries = 3 #retries of requests rejected with 429 Too Many Requests
+
+    def __init__(self, wrapper, session=None, cache=True, scheduler=None, priority=INTERACTIVE, token_manager=None):
+        '''
+            :wrapper: instance of igdb.wrapper.IGDBWrapper holding client id and token
+            :session: requests session to send calls through; defaults to the process-wide pooled session
+            :cache: True for the process-wide response cache, False/None for no caching, or an igdb_cache.ResponseCache
+            :scheduler: igdb_scheduler.RequestScheduler rate limiting the requests; defaults to the process-wide scheduler
+            :priority: priority class of this client's requests, igdb_scheduler.INTERACTIVE or igdb_scheduler.BACKGROUND
+            :token_manager: igdb_authentication.TokenManager; if given, each request uses its current token instead of the wrapper's
+        '''
         assert isinstance(wrapper, IGDBWrapper), 'wrapper must be instance of class igbd.wrapper.IGBWrapper'
         self.wrapper = wrapper
+        self.session = get_session() if session is None else session
+        self.cache = get_default_cache() if cache is True else (cache or None)
+        self.scheduler = get_default_scheduler() if scheduler is None else scheduler
+        self.priority = priority
+        self.token_manager = token_manager
     
-    def query_endpoint(self, endpoint:str, query:str):
+    def background_client(self):
+        '''
+            returns a client sharing this client's session, scheduler and token, sending uncached requests with background priority
+        '''
+        return IGBDAPI(self.wrapper, session=self.session, cache=False, scheduler=self.scheduler, priority=BACKGROUND, token_manager=self.token_manager)
+
+    def api_request(self, endpoint:str, query:str):
+        #Same request as IGDBWrapper.api_request, but rate limited and sent through the pooled keep-alive session
+        url = self.wrapper._build_url(endpoint)
+        params = self.wrapper._compose_request(query)
+        if self.token_manager is not None:
+            params['headers']['Authorization'] = f'Bearer {self.token_manager.token}'
+        for attempt in range(self._max_retries + 1):
+            with self.scheduler.slot(self.priority):
+                response = self.session.post(url, **params)
+            if response.status_code == 429 and attempt < self._max_retries:
+                time.sleep(self._retry_delay(response.headers.get('Retry-After'), attempt))
+                continue
+            response.raise_for_status()
+            return response.content
+
+    @staticmethod
+    def _retry_delay(retry_after, attempt):
+        '''
+            Seconds to wait before retrying a 429 response: the Retry-After header (seconds or an HTTP date),
+            or exponential backoff if there is none or it cannot be parsed
+        '''
+        backoff = 0.5*2**attempt
+        if not retry_after:
+            return backoff
+        try:
+            return max(0.0, float(retry_after))
+        except ValueError:
+            pass
+        try:
+            retry_at = parsedate_to_datetime(retry_after)
+        except (TypeError, ValueError, IndexError):
+            return backoff
+        if retry_at.tzinfo is None:
+            retry_at = retry_at.replace(tzinfo=timezone.utc)
+        return max(0.0, retry_at.timestamp() - time.time())
+
+    def query_endpoint(self, endpoint:str, query:str, cache=True):
         
-        byte_array = self.wrapper.api_request(
+        #cache=False skips the response cache for this request, both for reading and storing
+        cache = self.cache if cache else None
+        if cache is not None:
+            cache_key = normalize_query(query)
+            hit, data = cache.get(endpoint, cache_key)
+            if hit:
+                return data
+
+        byte_array = self.api_request(
                     endpoint,
                     query 
                     )
         try:
-            return json.loads(byte_array)
+            data = json.loads(byte_array)
         except requests.exceptions.RequestException as e:
             print('Error in request:', e)
         except Exception as e:
             evaluation_error = True
+        else:
+            if cache is not None:
+                cache.set(endpoint, cache_key, data, endpoint_ttl(endpoint, query))
+            return data
         if evaluation_error:
             print('Response format is not json/cannot be evaluated, returning as byte array')
             return byte_array
 
-    def multiquery(self, endpoint:str, result_name:str, query:str):
-        
+    @staticmethod
+    def _multiquery_block(endpoint:str, result_name:str, query:str):
         endpoint_result = f'query {endpoint} "{result_name}"'
         query = '' if not query else query
-        multiquery = endpoint_result + ' {' + query + '};'
+        return endpoint_result + ' {' + query + '};'
+
+    def multiquery(self, endpoint:str, result_name:str, query:str):
+        
+        multiquery = self._multiquery_block(endpoint, result_name, query)
         multiquery_result = self.query_endpoint('multiquery', multiquery)
         
         return multiquery_result
 
+    def multiquery_batch(self, queries, cache=True):
+        '''
+            :queries: list of (endpoint, result_name, query) tuples; result names must be unique
+            :cache: False to skip the response cache
+
+            Packs the queries into as few multiquery requests as possible (at most 10 sub-queries each).
+            returns a list with each query's result in the same order: the record list, or the count for "/count" endpoints.
+        '''
+        result_names = [result_name for _, result_name, _ in queries]
+        assert len(set(result_names)) == len(result_names), 'result names must be unique within a batch'
+
+        results = []
+        for start in range(0, len(queries), self._multiquery_limit):
+            chunk = queries[start:start+self._multiquery_limit]
+            multiquery = ' '.join([self._multiquery_block(*q) for q in chunk])
+            multiquery_result = self.query_endpoint('multiquery', multiquery, cache)
+            named_results = {r['name']: r for r in multiquery_result}
+            for endpoint, result_name, _ in chunk:
+                named_result = named_results.get(result_name, {})
+                if endpoint.endswith('/count'):
+                    results.append(named_result.get('count', 0))
+                else:
+                    results.append(named_result.get('result', []))
+        
+        return results
+
     def get_game_info(self, input, name_or_id='name', approximate_match=True):
         
         assert (name_or_id == 'name') or (name_or_id == 'id'), "Only name or id is accepted"
@@ -58,7 +167,8 @@ class IGBDAPI():
 
         return game_info
 
-    def get_lucky_game_info(self, limit=1, **where_filters):
+    @staticmethod
+    def lucky_where_clause(**where_filters):
         query_appendix = []
         
         for name,value in where_filters.items():
@@ -75,8 +185,26 @@ class IGBDAPI():
         else:
             query_appendix = ''
         
+        return query_appendix
+
+    def get_game_count(self, where:str):
+        return self.multiquery('games/count', 'Game count', f'fields name; where {where};')[0]['count']
+
+    def get_games_at_offsets(self, where:str, offsets, limit=1):
+        '''
+            Fetches `limit` games at each of the offsets among the games matching the where clause, in one multiquery per 10 offsets.
+
+            returns a list with the games found at each offset
+        '''
+        fields = igdb_utilities.game_fields
+        queries = [('games', f'Offset {offset}', f'fields {fields}; offset {offset}; limit {limit}; where {where};') for offset in offsets]
+        return self.multiquery_batch(queries)
+
+    def get_lucky_game_info(self, limit=1, **where_filters):
+        query_appendix = self.lucky_where_clause(**where_filters)
+        
         try:
-            game_count = self.multiquery('games/count', 'Game count', f'fields name; where {query_appendix};')[0]['count']
+            game_count = self.get_game_count(query_appendix)
             offset = random.randint(0, game_count-1)
             query = f'fields {igdb_utilities.game_fields}; offset {offset}; limit {limit}; where {query_appendix};' 
             game_info = self.query_endpoint('games', query)
@@ -88,14 +216,35 @@ class IGBDAPI():
             return game_info, game_count
 
     def get_involved_companies(self, game_id):
-        query = f'fields involved_companies; where id = {game_id};'
+        fields = igdb_utilities.involved_company_fields
+        query = f'fields {fields}; where id = {game_id};'
         data = self.query_endpoint('games', query)
         
-        developers, publishers = {}, {}
-        company_ids = ','.join([str(id) for id in data[0]['involved_companies']])
-        sub_query = f'fields company.name, developer, publisher; where id = ({company_ids});'
-        company_names = self.query_endpoint('involved_companies', sub_query)
+        return self._parse_involved_companies(data[0].get('involved_companies', []))
+
+    def get_games_involved_companies(self, game_ids):
+        '''
+            Batch variant of get_involved_companies; one request per 500 games.
+
+            returns dict mapping each found game id to a tuple (developers, publishers)
+        '''
+        fields = igdb_utilities.involved_company_fields
+        game_ids = sorted(set(game_ids))
+        
+        involved_companies = {}
+        page_size = 500
+        for start in range(0, len(game_ids), page_size):
+            ids = ','.join([str(g) for g in game_ids[start:start+page_size]])
+            query = f'fields {fields}; where id = ({ids}); limit {page_size};'
+            data = self.query_endpoint('games', query)
+            for game in data:
+                involved_companies[game['id']] = self._parse_involved_companies(game.get('involved_companies', []))
         
+        return involved_companies
+
+    @staticmethod
+    def _parse_involved_companies(company_names):
+        developers, publishers = {}, {}
         for sub_dict in company_names:
             if sub_dict['developer']:
                 developers[sub_dict['company']['id']] = sub_dict['company']['name']
@@ -106,11 +255,16 @@ class IGBDAPI():
 
     def get_multiplayer_modes(self, game_id):
         fields = igdb_utilities.multiplayer_fields
-        field_map = igdb_utilities.multiplayer_field_map
 
         query = f'fields {fields}; where game = {game_id};'
         raw_data = self.query_endpoint('multiplayer_modes', query)
 
+        return self._parse_multiplayer_modes(raw_data)
+
+    @staticmethod
+    def _parse_multiplayer_modes(raw_data):
+        field_map = igdb_utilities.multiplayer_field_map
+
         multiplayer_modes = {}
         for raw in raw_data:
             temp_dict = {}
@@ -153,56 +307,186 @@ class IGBDAPI():
         query = f'fields *; where game = {id};'
         raw_data = self.query_endpoint('game_videos', query)
         
+        return self._parse_game_video(raw_data, self.session, self.cache)
+
+    @staticmethod
+    def _parse_game_video(raw_data, session=None, cache=None):
         url = ''
         for raw in raw_data:
             video_type = raw['name']
             video_id = raw['video_id']
             if 'gameplay' in video_type.lower() or 'trailer' in video_type.lower():
                 url += f'https://www.youtube.com/watch?v={video_id}'
-                if not requests.get(url).status_code == 200:
+                #Validated in the background; unknown videos are shown until a probe finds them unavailable
+                if validate_video(video_id, session, cache) == False:
                     url = ''
                 break
         return url
 
-    def get_company_games(self, company_id):
+    def get_game_details(self, game_id, img_type='cover'):
+        '''
+            Fetches cover image url, video url, multiplayer modes and involved companies (developers, publishers)
+            of one game in a single multiquery round trip.
+        '''
+        queries = [
+            ('games', 'Image', f'fields {img_type}.url; where id = {game_id};'),
+            ('game_videos', 'Videos', f'fields *; where game = {game_id};'),
+            ('multiplayer_modes', 'Multiplayer modes', f'fields {igdb_utilities.multiplayer_fields}; where game = {game_id};'),
+            ('involved_companies', 'Involved companies', f'fields company.name, developer, publisher; where game = {game_id}; limit 50;')
+        ]
+        image, videos, multiplayer_modes, involved_companies = self.multiquery_batch(queries)
+
+        details = {
+            'image_url': 'https:' + image[0][img_type]['url'] if image and img_type in image[0] else '',
+            'game_video': self._parse_game_video(videos, self.session, self.cache),
+            'multiplayer_modes': self._parse_multiplayer_modes(multiplayer_modes),
+            'companies': self._parse_involved_companies(involved_companies) if involved_companies else None
+        }
         
-        company_query = f'fields name, published, developed; where id = {company_id};'
-        companies = self.query_endpoint('companies', company_query)
+        return details
+
+    def get_company_games(self, company_id, limit=10):
         
-        game_ids = []
-        if 'developed' in companies[0].keys():
-            game_ids += companies[0]['developed']*1
-        if 'published' in companies[0].keys():
-            game_ids += companies[0]['published']*1
+        return self.get_companies_games([company_id], limit).get(company_id, [])
+
+    def get_companies_games(self, company_ids, limit=10):
+        '''
+            Resolves the games of several companies with one companies query and one (paged) games query.
+
+            returns dict mapping each company id to the names of its best rated main games (at most limit), best first
+        '''
+        company_ids = sorted(set(company_ids))
+        if not company_ids:
+            return {}
         
-        game_ids = set(game_ids)
-        game_ids = '(' + ','.join([str(g) for g in game_ids]) + ')'
+        ids = ','.join([str(c) for c in company_ids])
+        company_query = f'fields name, published, developed; where id = ({ids}); limit {len(company_ids)};'
+        companies = self.query_endpoint('companies', company_query)
         
-        game_query = f'fields name; sort rating desc; where id={game_ids} & category=0 & rating != null;'
+        company_game_ids = {company_id: set() for company_id in company_ids}
+        for company in companies:
+            if company['id'] in company_game_ids:
+                company_game_ids[company['id']] = set(company.get('developed', []) + company.get('published', []))
         
-        game_data = self.query_endpoint('games', game_query)
-    
-        games = []
-        for element in game_data:
-            games.append(element['name'])
+        games = {company_id: [] for company_id in company_ids}
+        all_game_ids = set().union(*company_game_ids.values())
+        if not all_game_ids:
+            return games
+        
+        game_ids = '(' + ','.join([str(g) for g in sorted(all_game_ids)]) + ')'
+        page_size, offset = 500, 0
+        while True:
+            game_query = f'fields name; sort rating desc; where id={game_ids} & category=0 & rating != null; limit {page_size}; offset {offset};'
+            game_data = self.query_endpoint('games', game_query)
+            for element in game_data:
+                for company_id, these_game_ids in company_game_ids.items():
+                    if element['id'] in these_game_ids and len(games[company_id]) < limit:
+                        games[company_id].append(element['name'])
+            #Further pages are only needed while some company still lacks games and more games exist
+            if len(game_data) < page_size or all([len(games[c]) >= limit or len(games[c]) == len(company_game_ids[c]) for c in company_ids]):
+                break
+            offset += page_size
 
         return games
 
+    def iter_endpoint(self, endpoint:str, fields:str, where:str=None, page_size=500, workers=4, shard_dir=None, shard_format='jsonl', clean=False):
+        '''
+            Yields all records of an endpoint matching the where clause, in id order.
+
+            Reads the count first, then fetches pages of page_size records in parallel on `workers` threads,
+            within the scheduler's rate limits and with background priority.
+
+            :shard_dir: if given, each page is also written there as one shard file, e.g. games_00000.jsonl
+            :shard_format: "jsonl", or "parquet" (requires pandas with pyarrow)
+            :clean: if True, games and companies records are yielded (and written) as cleaned by igdb_utilities
+
+            Example (records for regenerating data/involved_companies_*.csv):
+                igdb.iter_endpoint('games', 'name, rating, involved_companies.company', 'first_release_date >= 1451606400 & rating != null')
+        '''
+        assert shard_format in ('jsonl', 'parquet'), 'shard_format must be jsonl or parquet'
+        client = self.background_client()
+        where_clause = f' where {where};' if where else ''
+        count = client.query_endpoint(f'{endpoint}/count', where_clause.strip() or 'fields id;')['count']
+        if shard_dir is not None:
+            os.makedirs(shard_dir, exist_ok=True)
+
+        def fetch(offset):
+            query = f'fields {fields};{where_clause} sort id asc; limit {page_size}; offset {offset};'
+            return client.query_endpoint(endpoint, query)
+
+        offsets = deque(range(0, count, page_size))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='igdb_export') as executor:
+            #At most two pages per worker are in flight, so memory stays bounded however large the endpoint is
+            in_flight = deque()
+            while offsets or in_flight:
+                while offsets and len(in_flight) < 2*workers:
+                    offset = offsets.popleft()
+                    in_flight.append((offset, executor.submit(fetch, offset)))
+                offset, future = in_flight.popleft()
+                records = future.result()
+                if clean and endpoint in self._batch_cleaners:
+                    records = list(self._batch_cleaners[endpoint](records))
+                if shard_dir is not None:
+                    self._write_shard(records, shard_dir, f"{endpoint.replace('/', '_')}_{offset//page_size:05d}", shard_format)
+                for record in records:
+                    yield record
+
+    _batch_cleaners = {
+        'games': igdb_utilities.clean_game_info_batch,
+        'companies': igdb_utilities.clean_company_info_batch
+    }
+
+    @staticmethod
+    def _write_shard(records, shard_dir:str, name:str, shard_format:str):
+        path = os.path.join(shard_dir, f'{name}.{shard_format}')
+        if shard_format == 'parquet':
+            import pandas as pd
+            pd.DataFrame(records).to_parquet(path)
+        else:
+            with open(path, 'w') as f:
+                for record in records:
+                    f.write(json.dumps(record) + '\n')
+
+    _taxonomy_queries = {
+        'game_modes': 'fields name; limit 50;',
+        'platforms': 'fields name; limit 50; where platform_family = (1,2,3,4,5) & platform_family != null;',
+        'genres': 'fields name; limit 50;'
+    }
+
     def get_all_game_modes(self):
-        game_mode_list = self.query_endpoint('game_modes', 'fields name; limit 50;')
+        game_mode_list = self.query_endpoint('game_modes', self._taxonomy_queries['game_modes'])
         game_mode_map = {g['name']: g['id'] for g in game_mode_list}
         return game_mode_map
 
     def get_all_platforms(self):
-        platform_list = self.query_endpoint('platforms', 'fields name; limit 50; where platform_family = (1,2,3,4,5) & platform_family != null;')
+        platform_list = self.query_endpoint('platforms', self._taxonomy_queries['platforms'])
         platform_map = {p['name']: p['id'] for p in platform_list}
         return platform_map
 
     def get_all_genres(self):
-        genre_list = self.query_endpoint('genres', 'fields name; limit 50;')
+        genre_list = self.query_endpoint('genres', self._taxonomy_queries['genres'])
         genre_map = {g['name']: g['id'] for g in genre_list}
         return genre_map
 
+    def get_all_taxonomies(self):
+        '''
+            Game modes, platforms and genres in one multiquery round trip. Always asks IGDB: the taxonomies are kept in
+            the taxonomy snapshot (igdb_taxonomy), which is refreshed through this method.
+
+            returns dict mapping each taxonomy ("game_modes", "platforms", "genres") to its name -> id map
+        '''
+        names = list(self._taxonomy_queries.keys())
+        results = self.multiquery_batch([(name, name, self._taxonomy_queries[name]) for name in names], cache=False)
+        return {name: {r['name']: r['id'] for r in result} for name, result in zip(names, results)}
+
+def default_client(priority=INTERACTIVE, cache=True):
+    '''
+        Returns an IGBDAPI client for the configured Twitch client id that always uses the process-wide token manager's token.
+    '''
+    tokens = token_manager()
+    wrapper = IGDBWrapper(os.environ.get('TWITCH_ID'), tokens.token)
+    return IGBDAPI(wrapper, cache=cache, priority=priority, token_manager=tokens)
+
 if __name__ == '__main__':
     wrapper = IGDBWrapper(os.environ.get('TWITCH_ID'), get_token())
     print(isinstance(wrapper, IGDBWrapper))
\ No newline at end of file
@@ -2,6 +2,10 @@ import requests
 import os
 from ast import literal_eval
 import json
+import time
+import threading
+
+_credentials_path = 'credentials/twitch_credentials.json'
 
 def authenticate_twitch():
     client_id = os.environ.get('TWITCH_ID')
@@ -11,15 +15,119 @@ def authenticate_twitch():
     if response.status_code == 200:
         content = response.content.decode('utf-8').replace("'", '"')
         data = literal_eval(content)
-        with open('credentials/twitch_credentials.json', 'w') as f:
+        data['obtained_at'] = time.time()
+        #Written to a temporary file first so that readers never see a half-written file
+        with open(_credentials_path + '.tmp', 'w') as f:
             json.dump(data, f, sort_keys=True, indent=3)
+        os.replace(_credentials_path + '.tmp', _credentials_path)
         return content
 
+class TokenManager:
+
+    '''
+        Keeps the Twitch token and its expiry in memory and refreshes it before it expires.
+
+        A background thread (see start) refreshes the token refresh_margin seconds before expiry while the old token is still served,
+        and concurrent callers that find the token expired share a single refresh. After a failed refresh, Twitch is not
+        asked again for retry_delay seconds.
+    '''
+
+    def __init__(self, credentials_path=_credentials_path, refresh_margin=24*3600, retry_delay=60):
+        self.credentials_path = credentials_path
+        self.refresh_margin = refresh_margin
+        self.retry_delay = retry_delay
+        self._failed_at = None
+        self._token = None
+        self._expires_at = 0.0
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._thread = None
+
+    def _load(self):
+        with open(self.credentials_path, 'r') as f:
+            credentials = json.load(f)
+        #Older credential files lack obtained_at; the file is written when the token is obtained
+        obtained_at = credentials.get('obtained_at', os.path.getmtime(self.credentials_path))
+        with self._lock:
+            self._token = credentials['access_token']
+            self._expires_at = obtained_at + credentials['expires_in']
+
+    @property
+    def expires_at(self):
+        return self._expires_at
+
+    def _needs_refresh(self):
+        return time.time() > self._expires_at - self.refresh_margin
+
+    def refresh(self, force=False):
+        '''
+            Fetches a new token from Twitch, unless another caller already did while this one waited.
+        '''
+        with self._refresh_lock:
+            if not force and self._token is not None and not self._needs_refresh():
+                return self._token
+            if not force and self._token is not None and self._failed_at is not None and time.time() - self._failed_at < self.retry_delay:
+                return self._token
+            try:
+                authenticated = authenticate_twitch() is not None
+            except requests.exceptions.RequestException as e:
+                print('Error in request:', e)
+                authenticated = False
+            if not authenticated:
+                print('Could not re-authenticate with Twitch, keeping current token')
+            self._failed_at = None if authenticated else time.time()
+            self._load()
+            return self._token
+
+    @property
+    def token(self):
+        if self._token is None:
+            with self._refresh_lock:
+                if self._token is None:
+                    self._load()
+        if time.time() >= self._expires_at:
+            return self.refresh()
+        return self._token
+
+    def _run(self):
+        while True:
+            try:
+                if self._token is None:
+                    self._load()
+                if self._needs_refresh():
+                    self.refresh()
+                delay = max(self.retry_delay, self._expires_at - self.refresh_margin - time.time())
+            except Exception as e:
+                print('Error in token refresh:', e)
+                delay = self.retry_delay
+            time.sleep(delay)
+
+    def start(self):
+        '''
+            Starts the background refresh thread; calling it again is a no-op.
+        '''
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='twitch_token_refresh', daemon=True)
+                self._thread.start()
+        return self
+
+_token_manager = None
+_token_manager_lock = threading.Lock()
+
+def token_manager():
+    '''
+        Returns the process-wide token manager.
+    '''
+    global _token_manager
+    if _token_manager is None:
+        with _token_manager_lock:
+            if _token_manager is None:
+                _token_manager = TokenManager()
+    return _token_manager
+
 def get_token():
-    with open('credentials/twitch_credentials.json', 'r') as f:
-        credentials = json.load(f)
-        f.close()
-    return credentials['access_token']
+    return token_manager().token
 
 if __name__ == '__main__':
-    authenticate_twitch()
\ No newline at end of file
+    authenticate_twitch()
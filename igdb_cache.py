@@ -0,0 +1,187 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+
+_default_path = os.environ.get('IGDB_CACHE_PATH', 'cache/igdb_cache.sqlite')
+
+hour = 3600
+day = 24*hour
+
+#Time to live (seconds) per IGDB endpoint; taxonomies change rarely, game data more often
+endpoint_ttls = {
+    'genres': 7*day,
+    'platforms': 7*day,
+    'game_modes': 7*day,
+    'player_perspectives': 7*day,
+    'themes': 7*day,
+    'companies': day,
+    'involved_companies': day,
+    'multiplayer_modes': day,
+    'game_videos': day,
+    'games': 6*hour,
+    'games/count': hour
+}
+default_ttl = 6*hour
+
+_multiquery_endpoint_pattern = re.compile(r'query\s+(\S+)\s+"')
+
+def normalize_query(query:str):
+    return ' '.join(query.split())
+
+def endpoint_ttl(endpoint:str, query:str=''):
+    '''
+        Returns time to live for a response of the endpoint; a multiquery lives as long as its shortest-lived sub-query.
+    '''
+    if endpoint == 'multiquery':
+        endpoints = _multiquery_endpoint_pattern.findall(query)
+        return min([endpoint_ttls.get(e, default_ttl) for e in endpoints]) if endpoints else default_ttl
+    return endpoint_ttls.get(endpoint, default_ttl)
+
+class ResponseCache:
+
+    '''
+        Two-tier (in-memory LRU on top of SQLite) cache for decoded API responses.
+
+        Entries are keyed on (namespace, key), e.g. (endpoint, normalized query), and expire after their time to live.
+        The memory tier holds at most max_memory_entries entries, the disk tier at most max_disk_bytes of serialized values;
+        least recently used entries are evicted first.
+    '''
+
+    def __init__(self, path=_default_path, max_memory_entries=2048, max_disk_bytes=200*1024**2):
+        '''
+            :path: SQLite file for the disk tier, None keeps the cache in memory only
+            :max_memory_entries: number of entries kept in the memory tier
+            :max_disk_bytes: total size of serialized values kept in the disk tier
+        '''
+        self.path = path
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_bytes = max_disk_bytes
+        self._memory = OrderedDict()
+        self._lock = threading.RLock()
+        self._stats = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'sets': 0, 'evictions': 0}
+        self._connection = None
+        self._disk_bytes = 0
+        if path is not None:
+            self._open()
+
+    def _open(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('''CREATE TABLE IF NOT EXISTS responses (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            expires_at REAL NOT NULL,
+            accessed_at REAL NOT NULL)''')
+        self._connection.execute('CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)')
+        self._connection.execute('DELETE FROM responses WHERE expires_at < ?', (time.time(),))
+        self._disk_bytes = self._connection.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+
+    @staticmethod
+    def _key(namespace:str, key:str):
+        return f'{namespace}\n{key}'
+
+    def get(self, namespace:str, key:str):
+        '''
+            returns tuple (hit, value); value is None on a miss
+        '''
+        cache_key = self._key(namespace, key)
+        now = time.time()
+        with self._lock:
+            if cache_key in self._memory:
+                expires_at, serialized = self._memory[cache_key]
+                if expires_at >= now:
+                    self._memory.move_to_end(cache_key)
+                    self._stats['memory_hits'] += 1
+                    #Decoded on every hit, so callers changing the value do not change what later hits return
+                    return True, json.loads(serialized)
+                del self._memory[cache_key]
+            if self._connection is not None:
+                row = self._connection.execute('SELECT value, expires_at FROM responses WHERE key = ?', (cache_key,)).fetchone()
+                if row is not None and row[1] >= now:
+                    self._connection.execute('UPDATE responses SET accessed_at = ? WHERE key = ?', (now, cache_key))
+                    self._set_memory(cache_key, row[1], row[0])
+                    self._stats['disk_hits'] += 1
+                    return True, json.loads(row[0])
+            self._stats['misses'] += 1
+            return False, None
+
+    def set(self, namespace:str, key:str, value, ttl:float):
+        cache_key = self._key(namespace, key)
+        now = time.time()
+        expires_at = now + ttl
+        serialized = json.dumps(value)
+        with self._lock:
+            self._set_memory(cache_key, expires_at, serialized)
+            self._stats['sets'] += 1
+            if self._connection is not None:
+                size = len(serialized)
+                previous = self._connection.execute('SELECT size FROM responses WHERE key = ?', (cache_key,)).fetchone()
+                self._connection.execute('INSERT OR REPLACE INTO responses (key, value, size, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?)',
+                    (cache_key, serialized, size, expires_at, now))
+                self._disk_bytes += size - (previous[0] if previous else 0)
+                if self._disk_bytes > self.max_disk_bytes:
+                    self._evict_disk()
+
+    def _set_memory(self, cache_key, expires_at, serialized:str):
+        self._memory[cache_key] = (expires_at, serialized)
+        self._memory.move_to_end(cache_key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+            self._stats['evictions'] += 1
+
+    def _evict_disk(self):
+        #Drop expired entries first, then least recently used ones until below 90% of the size limit
+        self._connection.execute('DELETE FROM responses WHERE expires_at < ?', (time.time(),))
+        self._disk_bytes = self._connection.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+        target = 0.9*self.max_disk_bytes
+        rows = self._connection.execute('SELECT key, size FROM responses ORDER BY accessed_at').fetchall()
+        evicted = []
+        for key, size in rows:
+            if self._disk_bytes <= target:
+                break
+            evicted.append((key,))
+            self._disk_bytes -= size
+        self._connection.executemany('DELETE FROM responses WHERE key = ?', evicted)
+        self._stats['evictions'] += len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            if self._connection is not None:
+                self._connection.execute('DELETE FROM responses')
+                self._disk_bytes = 0
+
+    @property
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['memory_entries'] = len(self._memory)
+            stats['disk_bytes'] = self._disk_bytes
+        lookups = stats['memory_hits'] + stats['disk_hits'] + stats['misses']
+        stats['hit_rate'] = (stats['memory_hits'] + stats['disk_hits'])/lookups if lookups else 0.0
+        return stats
+
+    def __repr__(self):
+        return f'Instance of ResponseCache class, path={self.path}, max_memory_entries={self.max_memory_entries}, max_disk_bytes={self.max_disk_bytes}'
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+def get_default_cache():
+    '''
+        Returns the process-wide response cache used by IGBDAPI unless another cache is given.
+    '''
+    global _default_cache
+    if _default_cache is None:
+        with _default_cache_lock:
+            if _default_cache is None:
+                _default_cache = ResponseCache()
+    return _default_cache
@@ -0,0 +1,153 @@
+import time
+import random
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from igdb_api import IGBDAPI
+
+class LuckySearch:
+
+    '''
+        Answers "Lucky search" requests, mostly from memory.
+
+        Game counts are cached per canonical filter set. Filter sets asked for at least `popular_after` times get a pool of
+        `pool_size` pre-fetched random games, which is refilled in the background (with background priority) when it runs low.
+    '''
+
+    def __init__(self, igdb:IGBDAPI, count_ttl=3600, pool_size=10, popular_after=2, max_pools=50, max_filter_sets=1000):
+        '''
+            :igdb: client used for requests made while the user waits
+            :count_ttl: seconds a game count is reused for
+            :pool_size: number of random games kept per popular filter set (at most 10, the multiquery limit)
+            :popular_after: number of requests after which a filter set gets a pool
+            :max_pools: number of pools kept; the least recently used pool is dropped first
+            :max_filter_sets: number of filter sets whose game count and number of requests are kept, least recently used dropped first
+        '''
+        self.igdb = igdb
+        self.background_igdb = igdb.background_client()
+        self.count_ttl = count_ttl
+        self.pool_size = min(pool_size, IGBDAPI._multiquery_limit)
+        self.popular_after = popular_after
+        self.max_pools = max_pools
+        self.max_filter_sets = max_filter_sets
+        self._counts = OrderedDict()
+        self._requests = OrderedDict()
+        self._pools = OrderedDict()
+        self._refilling = set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='lucky_search')
+        self._stats = {'pool_hits': 0, 'pool_misses': 0, 'count_hits': 0, 'count_misses': 0, 'refills': 0}
+
+    @staticmethod
+    def canonical_filters(where_filters:dict):
+        return tuple(sorted((name, str(value).replace(' ', '')) for name, value in where_filters.items()))
+
+    def _remember(self, entries:OrderedDict, key, value):
+        #Caller holds the lock
+        entries[key] = value
+        entries.move_to_end(key)
+        while len(entries) > self.max_filter_sets:
+            entries.popitem(last=False)
+
+    def _cached_count(self, key):
+        #Caller holds the lock; expired counts are dropped
+        cached = self._counts.get(key)
+        if cached is None:
+            return None
+        if cached[0] <= time.time():
+            del self._counts[key]
+            return None
+        self._counts.move_to_end(key)
+        return cached[1]
+
+    def game_count(self, key, where:str):
+        with self._lock:
+            game_count = self._cached_count(key)
+            if game_count is not None:
+                self._stats['count_hits'] += 1
+                return game_count
+            self._stats['count_misses'] += 1
+        game_count = self.igdb.get_game_count(where)
+        with self._lock:
+            #Counts run out at the rate they are fetched, so expired ones are swept here
+            now = time.time()
+            for expired in [k for k, (expires_at, _) in self._counts.items() if expires_at <= now]:
+                del self._counts[expired]
+            self._remember(self._counts, key, (now + self.count_ttl, game_count))
+        return game_count
+
+    def _refill(self, key, where:str):
+        try:
+            game_count = self.game_count(key, where)
+            with self._lock:
+                missing = self.pool_size - len(self._pools.get(key, ()))
+            if missing <= 0 or game_count == 0:
+                return
+            offsets = random.sample(range(game_count), min(missing, game_count))
+            results = self.background_igdb.get_games_at_offsets(where, offsets)
+            with self._lock:
+                if key in self._pools:
+                    self._pools[key].extend([games[0] for games in results if games])
+                self._stats['refills'] += 1
+        except Exception as e:
+            print('Error in lucky pool refill:', e)
+        finally:
+            with self._lock:
+                self._refilling.discard(key)
+
+    def _schedule_refill(self, key, where:str):
+        #Caller holds the lock
+        if key in self._refilling:
+            return
+        if key not in self._pools:
+            self._pools[key] = deque()
+            while len(self._pools) > self.max_pools:
+                self._pools.popitem(last=False)
+        self._refilling.add(key)
+        self._executor.submit(self._refill, key, where)
+
+    def lucky_game_info(self, limit=1, **where_filters):
+        '''
+            Same interface as IGBDAPI.get_lucky_game_info: returns tuple (game_info, game_count), or None if nothing was found.
+        '''
+        key = self.canonical_filters(where_filters)
+        where = self.igdb.lucky_where_clause(**where_filters)
+
+        if limit == 1:
+            with self._lock:
+                self._remember(self._requests, key, self._requests.get(key, 0) + 1)
+                pool = self._pools.get(key)
+                game = pool.popleft() if pool else None
+                if pool is not None:
+                    self._pools.move_to_end(key)
+                if game is not None:
+                    self._stats['pool_hits'] += 1
+                    game_count = self._cached_count(key)
+                else:
+                    self._stats['pool_misses'] += 1
+                if self._requests[key] >= self.popular_after and (pool is None or len(pool) < self.pool_size//2):
+                    self._schedule_refill(key, where)
+            if game is not None:
+                try:
+                    #The count the pool was drawn with may have expired since
+                    return [game], game_count if game_count is not None else self.game_count(key, where)
+                except Exception as e:
+                    print(e)
+
+        try:
+            game_count = self.game_count(key, where)
+            offset = random.randint(0, game_count-1)
+            game_info = self.igdb.get_games_at_offsets(where, [offset], limit)[0]
+            if len(game_info) == 0:
+                raise Exception
+        except Exception as e:
+            print(e)
+        else:
+            return game_info, game_count
+
+    @property
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['pools'] = {key: len(pool) for key, pool in self._pools.items()}
+        return stats
@@ -0,0 +1,430 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+from igdb_api import IGBDAPI, default_client
+from igdb_scheduler import BACKGROUND
+import igdb_utilities
+
+_default_path = os.environ.get('IGDB_MIRROR_PATH', 'cache/igdb_mirror.sqlite')
+
+#Endpoints mirrored, in sync order, and the fields stored for each; every record also stores updated_at
+mirror_fields = OrderedDict([
+    ('genres', 'name'),
+    ('game_modes', 'name'),
+    ('platforms', 'name, platform_family'),
+    ('companies', igdb_utilities.company_fields),
+    ('involved_companies', 'company, developer, publisher, game'),
+    ('game_videos', 'game, name, video_id'),
+    ('multiplayer_modes', igdb_utilities.multiplayer_fields + ', game'),
+    ('games', igdb_utilities.game_fields + ', cover.url, rating, involved_companies, release_dates.date')
+])
+
+def _field_names(fields:str):
+    '''
+        returns the top level record keys of an IGDB fields list, e.g. {"genres", "name"} for "genres.name, name"
+    '''
+    return set([field.strip().split('.')[0] for field in fields.split(',') if field.strip()]) | {'id'}
+
+#Keys returned by the read interface, so mirror records look like the records IGBDAPI asks IGDB for
+_game_keys = _field_names(igdb_utilities.game_fields)
+_company_keys = _field_names(igdb_utilities.company_fields)
+_multiplayer_keys = _field_names(igdb_utilities.multiplayer_fields)
+
+def _project(records, keys):
+    return [{key: value for key, value in record.items() if key in keys} for record in records]
+
+class IGDBMirror:
+
+    '''
+        Local SQLite copy of the IGDB catalog, kept up to date by sync.
+
+        Records are stored as json per (endpoint, id), with name, rating and updated_at as indexed columns.
+        Sync pages through each endpoint by id, only asking for records updated since the last completed sync,
+        and saves its position after every page so that an interrupted sync resumes where it stopped.
+    '''
+
+    page_size = 500 #maximum limit IGDB accepts
+    _since_margin = 3600 #records updated up to this many seconds before a sync started are fetched again by the next one
+
+    def __init__(self, path=_default_path):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.RLock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._connection:
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute('''CREATE TABLE IF NOT EXISTS records (
+                endpoint TEXT NOT NULL,
+                id INTEGER NOT NULL,
+                name TEXT,
+                name_lower TEXT,
+                rating REAL,
+                updated_at INTEGER,
+                data TEXT NOT NULL,
+                PRIMARY KEY (endpoint, id))''')
+            self._connection.execute('CREATE INDEX IF NOT EXISTS records_name ON records (endpoint, name_lower)')
+            #game_videos and multiplayer_modes are looked up by their game
+            self._connection.execute("CREATE INDEX IF NOT EXISTS records_game ON records (endpoint, json_extract(data, '$.game'))")
+            self._connection.execute('''CREATE TABLE IF NOT EXISTS involved_companies (
+                id INTEGER PRIMARY KEY,
+                game INTEGER,
+                company INTEGER,
+                developer INTEGER,
+                publisher INTEGER)''')
+            self._connection.execute('CREATE INDEX IF NOT EXISTS involved_companies_game ON involved_companies (game)')
+            self._connection.execute('CREATE INDEX IF NOT EXISTS involved_companies_company ON involved_companies (company)')
+            self._connection.execute('''CREATE TABLE IF NOT EXISTS sync_state (
+                endpoint TEXT PRIMARY KEY,
+                since INTEGER NOT NULL,
+                last_id INTEGER NOT NULL,
+                started_at INTEGER,
+                completed_at INTEGER)''')
+
+    ### SYNC
+    def _sync_state(self, endpoint):
+        row = self._connection.execute('SELECT since, last_id, started_at FROM sync_state WHERE endpoint = ?', (endpoint,)).fetchone()
+        return row if row is not None else (0, 0, None)
+
+    def _store(self, endpoint, records):
+        rows, involved = [], []
+        for record in records:
+            name = record.get('name')
+            rows.append((endpoint, record['id'], name, name.lower() if isinstance(name, str) else None,
+                record.get('rating'), record.get('updated_at'), json.dumps(record)))
+            if endpoint == 'involved_companies':
+                involved.append((record['id'], record.get('game'), record.get('company'), record.get('developer', False), record.get('publisher', False)))
+        self._connection.executemany('INSERT OR REPLACE INTO records (endpoint, id, name, name_lower, rating, updated_at, data) VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+        if involved:
+            self._connection.executemany('INSERT OR REPLACE INTO involved_companies (id, game, company, developer, publisher) VALUES (?, ?, ?, ?, ?)', involved)
+
+    def sync_endpoint(self, igdb:IGBDAPI, endpoint:str, max_pages=None):
+        '''
+            Fetches records of the endpoint updated since the last completed sync, resuming an interrupted sync.
+
+            :igdb: client used for fetching, preferably with background priority and without response cache
+            :max_pages: stop after this many pages (the sync resumes from there next time)
+
+            returns number of records stored
+        '''
+        fields = ' '.join(mirror_fields[endpoint].split()) + ', updated_at'
+        with self._lock:
+            since, last_id, started_at = self._sync_state(endpoint)
+            if started_at is None or last_id == 0:
+                started_at = int(time.time())
+
+        stored, pages = 0, 0
+        while max_pages is None or pages < max_pages:
+            query = f'fields {fields}; where updated_at > {since} & id > {last_id}; sort id asc; limit {self.page_size};'
+            records = igdb.query_endpoint(endpoint, query)
+            pages += 1
+            with self._lock, self._connection:
+                self._store(endpoint, records)
+                if records:
+                    last_id = records[-1]['id']
+                self._connection.execute('INSERT OR REPLACE INTO sync_state (endpoint, since, last_id, started_at, completed_at) VALUES (?, ?, ?, ?, NULL)',
+                    (endpoint, since, last_id, started_at))
+            stored += len(records)
+            if len(records) < self.page_size:
+                #Completed; the next sync asks for what was updated since this one started
+                with self._lock, self._connection:
+                    self._connection.execute('INSERT OR REPLACE INTO sync_state (endpoint, since, last_id, started_at, completed_at) VALUES (?, ?, 0, NULL, ?)',
+                        (endpoint, started_at - self._since_margin, int(time.time())))
+                break
+        print(f'Mirrored {stored} {endpoint} records')
+        return stored
+
+    def sync(self, igdb:IGBDAPI=None, endpoints=None, max_pages=None):
+        '''
+            Incrementally syncs the mirrored endpoints (all by default); returns dict with number of records stored per endpoint.
+        '''
+        if igdb is None:
+            igdb = default_client(priority=BACKGROUND, cache=False)
+        endpoints = list(mirror_fields.keys()) if endpoints is None else endpoints
+        return {endpoint: self.sync_endpoint(igdb, endpoint, max_pages) for endpoint in endpoints}
+
+    @property
+    def sync_status(self):
+        with self._lock:
+            rows = self._connection.execute('SELECT endpoint, since, last_id, completed_at FROM sync_state').fetchall()
+            counts = dict(self._connection.execute('SELECT endpoint, COUNT(*) FROM records GROUP BY endpoint').fetchall())
+        return {endpoint: {'records': counts.get(endpoint, 0), 'since': since, 'resume_from_id': last_id, 'completed_at': completed_at}
+            for endpoint, since, last_id, completed_at in rows}
+
+    def sync_completed_at(self, endpoint:str):
+        '''
+            returns time the last sync of the endpoint completed, or None if none has
+        '''
+        with self._lock:
+            row = self._connection.execute('SELECT MAX(completed_at) FROM sync_state WHERE endpoint = ?', (endpoint,)).fetchone()
+        return row[0]
+
+    ### READ
+    def records(self, endpoint:str, where:str='', parameters=(), order:str='', limit=None, offset=None):
+        sql = 'SELECT data FROM records WHERE endpoint = ?' + (f' AND {where}' if where else '') + (f' ORDER BY {order}' if order else '')
+        if limit is not None:
+            sql += f' LIMIT {int(limit)}'
+            if offset is not None:
+                sql += f' OFFSET {int(offset)}'
+        with self._lock:
+            rows = self._connection.execute(sql, (endpoint,) + tuple(parameters)).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def records_by_id(self, endpoint:str, ids):
+        ids = [int(i) for i in ids]
+        if not ids:
+            return []
+        placeholders = ','.join(['?']*len(ids))
+        return self.records(endpoint, f'id IN ({placeholders})', ids)
+
+    def game_records(self, endpoint:str, game_id):
+        '''
+            returns records of an endpoint referring to a game (game_videos, multiplayer_modes)
+        '''
+        return self.records(endpoint, "json_extract(data, '$.game') = ?", (int(game_id),), order='id')
+
+    def count(self, endpoint:str, where:str='', parameters=()):
+        sql = 'SELECT COUNT(*) FROM records WHERE endpoint = ?' + (f' AND {where}' if where else '')
+        with self._lock:
+            return self._connection.execute(sql, (endpoint,) + tuple(parameters)).fetchone()[0]
+
+    def involved_companies(self, game_id=None, company_ids=None):
+        if game_id is not None:
+            sql, parameters = 'SELECT game, company, developer, publisher FROM involved_companies WHERE game = ?', (int(game_id),)
+        else:
+            company_ids = [int(c) for c in company_ids]
+            sql = f'SELECT game, company, developer, publisher FROM involved_companies WHERE company IN ({",".join(["?"]*len(company_ids))})'
+            parameters = tuple(company_ids)
+        with self._lock:
+            return self._connection.execute(sql, parameters).fetchall()
+
+class MirroredIGBDAPI:
+
+    '''
+        Read interface with the same methods as IGBDAPI, served from an IGDBMirror.
+
+        Methods not covered by the mirror, and lookups the mirror has no data for, go to the live client if one is given.
+    '''
+
+    def __init__(self, mirror:IGDBMirror, live:IGBDAPI=None):
+        self.mirror = mirror
+        self.live = live
+
+    def __getattr__(self, name):
+        if self.live is None:
+            raise AttributeError(f'{name} is not served by the mirror and no live client is set')
+        return getattr(self.live, name)
+
+    def _fallback(self, method, *args, **kwargs):
+        if self.live is None:
+            raise LookupError(f'{method} found no data in the mirror')
+        return getattr(self.live, method)(*args, **kwargs)
+
+    def get_game_info(self, input, name_or_id='name', approximate_match=True):
+
+        assert (name_or_id == 'name') or (name_or_id == 'id'), "Only name or id is accepted"
+
+        if name_or_id == 'name':
+            if not approximate_match:
+                game_info = self.mirror.records('games', 'name_lower = ?', (str(input).lower(),))
+            else:
+                game_info = self.mirror.records('games', "name_lower LIKE ? ESCAPE '\\'", ('%' + _escape_like(str(input).lower()) + '%',),
+                    order='rating IS NULL, rating DESC', limit=10)
+        else:
+            game_info = self.mirror.records_by_id('games', [input])
+        if not game_info:
+            return self._fallback('get_game_info', input, name_or_id, approximate_match)
+
+        return _project(game_info, _game_keys)
+
+    def get_involved_companies(self, game_id):
+        rows = self.mirror.involved_companies(game_id=game_id)
+        if not rows:
+            return self._fallback('get_involved_companies', game_id)
+
+        return self._parse_involved_companies(rows)
+
+    def _parse_involved_companies(self, rows):
+        company_names = {c['id']: c.get('name') for c in self.mirror.records_by_id('companies', set([row[1] for row in rows]))}
+        developers, publishers = {}, {}
+        for _, company_id, developer, publisher in rows:
+            if developer:
+                developers[company_id] = company_names.get(company_id)
+            if publisher:
+                publishers[company_id] = company_names.get(company_id)
+
+        return developers, publishers
+
+    def get_company_info(self, input, name_or_id:str, approximate_match=True):
+
+        assert (name_or_id == 'name') or (name_or_id == 'id'), "Only name or id is accepted"
+
+        if name_or_id == 'name':
+            if not approximate_match:
+                data = self.mirror.records('companies', 'name_lower = ?', (str(input).lower(),))
+            else:
+                data = self.mirror.records('companies', "name_lower LIKE ? ESCAPE '\\'", ('%' + _escape_like(str(input).lower()) + '%',), limit=10)
+        else:
+            data = self.mirror.records_by_id('companies', [input])
+        if not data:
+            return self._fallback('get_company_info', input, name_or_id, approximate_match)
+
+        return _project(data, _company_keys)
+
+    def get_image_url(self, id, endpoint='games', img_type='cover'):
+        data = self.mirror.records_by_id(endpoint, [id])
+        if not data or img_type not in data[0] or 'url' not in data[0][img_type]:
+            return self._fallback('get_image_url', id, endpoint, img_type)
+
+        return 'https:' + data[0][img_type]['url']
+
+    def _game_mirrored(self, game_id):
+        return len(self.mirror.records_by_id('games', [game_id])) > 0
+
+    def get_game_video(self, id):
+        if not self._game_mirrored(id):
+            return self._fallback('get_game_video', id)
+
+        return IGBDAPI._parse_game_video(self.mirror.game_records('game_videos', id))
+
+    def get_multiplayer_modes(self, game_id):
+        if not self._game_mirrored(game_id):
+            return self._fallback('get_multiplayer_modes', game_id)
+
+        return IGBDAPI._parse_multiplayer_modes(_project(self.mirror.game_records('multiplayer_modes', game_id), _multiplayer_keys))
+
+    def get_game_details(self, game_id, img_type='cover'):
+        '''
+            Same as IGBDAPI.get_game_details, served from the mirror; games the mirror does not have are fetched live.
+        '''
+        game = self.mirror.records_by_id('games', [game_id])
+        if not game:
+            return self._fallback('get_game_details', game_id, img_type)
+
+        image = game[0].get(img_type, {})
+        involved_companies = self.mirror.involved_companies(game_id=game_id)
+        details = {
+            'image_url': 'https:' + image['url'] if 'url' in image else '',
+            'game_video': IGBDAPI._parse_game_video(self.mirror.game_records('game_videos', game_id)),
+            'multiplayer_modes': IGBDAPI._parse_multiplayer_modes(_project(self.mirror.game_records('multiplayer_modes', game_id), _multiplayer_keys)),
+            'companies': self._parse_involved_companies(involved_companies) if involved_companies else None
+        }
+
+        return details
+
+    ### LUCKY SEARCH
+    lucky_where_clause = staticmethod(IGBDAPI.lucky_where_clause)
+
+    def background_client(self):
+        return MirroredIGBDAPI(self.mirror, None if self.live is None else self.live.background_client())
+
+    def get_game_count(self, where:str):
+        query = _lucky_sql(where)
+        game_count = self.mirror.count('games', *query) if query is not None else 0
+        if game_count == 0:
+            return self._fallback('get_game_count', where)
+
+        return game_count
+
+    def get_games_at_offsets(self, where:str, offsets, limit=1):
+        query = _lucky_sql(where)
+        if query is None:
+            return self._fallback('get_games_at_offsets', where, offsets, limit)
+
+        return [_project(self.mirror.records('games', *query, order='id', limit=limit, offset=offset), _game_keys) for offset in offsets]
+
+    def get_company_games(self, company_id, limit=10):
+
+        return self.get_companies_games([company_id], limit).get(company_id, [])
+
+    def get_companies_games(self, company_ids, limit=10):
+        company_ids = sorted(set(company_ids))
+        rows = self.mirror.involved_companies(company_ids=company_ids)
+        if company_ids and not rows:
+            return self._fallback('get_companies_games', company_ids, limit)
+
+        company_game_ids = {company_id: set() for company_id in company_ids}
+        for game_id, company_id, developer, publisher in rows:
+            if developer or publisher:
+                company_game_ids[company_id].add(game_id)
+
+        all_games = self.mirror.records_by_id('games', set().union(*company_game_ids.values()))
+        rated_games = sorted([g for g in all_games if g.get('category', 0) == 0 and g.get('rating') is not None], key=lambda g: g['rating'], reverse=True)
+
+        games = {}
+        for company_id, game_ids in company_game_ids.items():
+            games[company_id] = [g['name'] for g in rated_games if g['id'] in game_ids][:limit]
+
+        return games
+
+    def _taxonomy_map(self, endpoint, method, where='', parameters=()):
+        data = self.mirror.records(endpoint, where, parameters)
+        if not data:
+            return self._fallback(method)
+        return {d['name']: d['id'] for d in data}
+
+    def get_all_game_modes(self):
+        return self._taxonomy_map('game_modes', 'get_all_game_modes')
+
+    def get_all_platforms(self):
+        return self._taxonomy_map('platforms', 'get_all_platforms', "json_extract(data, '$.platform_family') IN (1,2,3,4,5)")
+
+    def get_all_genres(self):
+        return self._taxonomy_map('genres', 'get_all_genres')
+
+#Filters of IGBDAPI.lucky_where_clause the mirror answers, as SQL over the games records; {op} is the comparison operator
+_lucky_conditions = {
+    'rating': 'rating {op} ?',
+    'release_dates.date': "EXISTS (SELECT 1 FROM json_each(data, '$.release_dates') WHERE json_extract(value, '$.date') {op} ?)",
+    'multiplayer_modes.onlinemax': '''EXISTS (SELECT 1 FROM records m WHERE m.endpoint = 'multiplayer_modes'
+        AND json_extract(m.data, '$.game') = records.id AND json_extract(m.data, '$.onlinemax') {op} ?)'''
+}
+_lucky_id_list_fields = ('genres', 'game_modes', 'platforms')
+
+def _lucky_sql(where:str):
+    '''
+        Translates a where clause built by IGBDAPI.lucky_where_clause (e.g. "genres=[12,31] & platforms=(6,48) & rating>=80") into an SQL
+        condition and parameters; returns None if it has a filter the mirror cannot answer
+    '''
+    conditions, parameters = [], []
+    for condition in [c.strip() for c in where.split('&') if c.strip()]:
+        for op in ('>=', '<=', '=', '<', '>'):
+            name, found, value = condition.partition(op)
+            if found:
+                break
+        else:
+            return None
+        name, value = name.strip(), value.strip()
+        try:
+            if name in _lucky_id_list_fields and op == '=':
+                #Apicalypse "= (a,b)": has any of the ids, "= [a,b]": has all of them
+                all_of = value.startswith('[') and value.endswith(']')
+                ids = [int(i) for i in value.strip('()[]').split(',') if i.strip()]
+                if not ids:
+                    return None
+                has_id = f"EXISTS (SELECT 1 FROM json_each(data, '$.{name}') WHERE json_extract(value, '$.id') IN ({{}}))"
+                if all_of:
+                    conditions += [has_id.format('?')]*len(ids)
+                else:
+                    conditions.append(has_id.format(','.join(['?']*len(ids))))
+                parameters += ids
+            elif name in _lucky_conditions:
+                conditions.append(_lucky_conditions[name].format(op=op))
+                parameters.append(float(value))
+            else:
+                return None
+        except ValueError:
+            return None
+    return ' AND '.join(conditions), tuple(parameters)
+
+def _escape_like(text:str):
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+if __name__ == '__main__':
+    mirror = IGDBMirror()
+    mirror.sync()
+    print(mirror.sync_status)
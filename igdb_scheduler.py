@@ -0,0 +1,130 @@
+import os
+import time
+import heapq
+import itertools
+import threading
+from contextlib import contextmanager
+
+#Priority classes; lower value is served first
+INTERACTIVE = 0
+BACKGROUND = 1
+
+class SchedulerQueueFull(Exception):
+    pass
+
+class RequestScheduler:
+
+    '''
+        Process-wide token bucket scheduler for outgoing API requests.
+
+        Requests take a slot before they are sent: at most `rate` slots are handed out per second (with bursts of up to `burst`),
+        at most `max_concurrent` requests are open at once, and waiting requests are served by priority class, then in arrival order.
+        At most `max_queue` requests may wait; further requests raise SchedulerQueueFull.
+    '''
+
+    def __init__(self, rate=4.0, burst=4, max_concurrent=8, max_queue=200):
+        self.rate = rate
+        self.burst = burst
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self._tokens = float(burst)
+        self._last_refill = time.monotonic()
+        self._active = 0
+        self._queue = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._stats = {'requests': 0, 'rejected': 0, 'timeouts': 0, 'total_wait': 0.0, 'max_wait': 0.0}
+        self._priority_waits = {}
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._last_refill)*self.rate)
+        self._last_refill = now
+
+    def _acquire(self, priority, timeout):
+        enqueued = time.monotonic()
+        deadline = None if timeout is None else enqueued + timeout
+        with self._condition:
+            if len(self._queue) >= self.max_queue:
+                self._stats['rejected'] += 1
+                raise SchedulerQueueFull(f'{len(self._queue)} requests are already waiting')
+            ticket = (priority, next(self._sequence))
+            heapq.heappush(self._queue, ticket)
+            while True:
+                wait = None
+                if self._queue[0] == ticket and self._active < self.max_concurrent:
+                    self._refill()
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        heapq.heappop(self._queue)
+                        self._active += 1
+                        break
+                    wait = (1 - self._tokens)/self.rate
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._queue.remove(ticket)
+                        heapq.heapify(self._queue)
+                        self._stats['timeouts'] += 1
+                        self._condition.notify_all()
+                        raise TimeoutError(f'no request slot within {timeout} seconds')
+                    wait = remaining if wait is None else min(wait, remaining)
+                self._condition.wait(wait)
+            #Next in line may be able to go as well
+            self._condition.notify_all()
+            waited = time.monotonic() - enqueued
+            self._stats['requests'] += 1
+            self._stats['total_wait'] += waited
+            self._stats['max_wait'] = max(self._stats['max_wait'], waited)
+            count, total = self._priority_waits.get(priority, (0, 0.0))
+            self._priority_waits[priority] = (count + 1, total + waited)
+
+    def _release(self):
+        with self._condition:
+            self._active -= 1
+            self._condition.notify_all()
+
+    @contextmanager
+    def slot(self, priority=INTERACTIVE, timeout=None):
+        '''
+            Context manager holding one request slot, e.g.
+
+            with scheduler.slot(BACKGROUND):
+                session.post(...)
+        '''
+        self._acquire(priority, timeout)
+        try:
+            yield
+        finally:
+            self._release()
+
+    @property
+    def stats(self):
+        with self._condition:
+            stats = dict(self._stats)
+            stats['queue_depth'] = len(self._queue)
+            stats['active'] = self._active
+            stats['mean_wait'] = stats['total_wait']/stats['requests'] if stats['requests'] else 0.0
+            stats['mean_wait_by_priority'] = {p: total/count for p, (count, total) in self._priority_waits.items()}
+        return stats
+
+    def __repr__(self):
+        return f'Instance of RequestScheduler class, rate={self.rate}, burst={self.burst}, max_concurrent={self.max_concurrent}, max_queue={self.max_queue}'
+
+_default_scheduler = None
+_default_scheduler_lock = threading.Lock()
+
+def get_default_scheduler():
+    '''
+        Returns the process-wide IGDB scheduler; IGDB allows about 4 requests per second and 8 open requests.
+    '''
+    global _default_scheduler
+    if _default_scheduler is None:
+        with _default_scheduler_lock:
+            if _default_scheduler is None:
+                _default_scheduler = RequestScheduler(
+                    rate=float(os.environ.get('IGDB_RATE', 4)),
+                    burst=int(os.environ.get('IGDB_BURST', 4)),
+                    max_concurrent=int(os.environ.get('IGDB_MAX_CONCURRENT', 8)),
+                    max_queue=int(os.environ.get('IGDB_MAX_QUEUE', 200)))
+    return _default_scheduler
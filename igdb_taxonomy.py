@@ -0,0 +1,113 @@
+import os
+import json
+import time
+import threading
+from igdb_api import default_client
+from igdb_scheduler import BACKGROUND
+from igdb_cache import day
+
+_default_path = os.environ.get('IGDB_TAXONOMY_PATH', os.path.join('cache', 'taxonomy_snapshot.json'))
+
+taxonomy_names = ('genres', 'platforms', 'game_modes')
+
+class TaxonomySnapshot:
+
+    '''
+        Versioned on-disk snapshot of the IGDB genres, platforms and game modes (name -> id maps).
+
+        Every process loads the snapshot file instead of asking IGDB; a background thread (see start) re-reads the file when
+        another process has replaced it and fetches a new version from IGDB once the snapshot is older than max_age seconds.
+    '''
+
+    def __init__(self, path=_default_path, max_age=day):
+        self.path = path
+        self.max_age = max_age
+        self.version = 0
+        self.created_at = 0.0
+        self.taxonomies = {}
+        self._loaded_mtime = None
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def load(self):
+        '''
+            Reads the snapshot file; returns False if there is none (or it cannot be read).
+        '''
+        try:
+            mtime = os.path.getmtime(self.path)
+            with open(self.path, 'r') as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError) as e:
+            print('Taxonomy snapshot not loaded:', e)
+            return False
+        with self._lock:
+            self.version = snapshot['version']
+            self.created_at = snapshot['created_at']
+            self.taxonomies = {name: snapshot[name] for name in taxonomy_names}
+            self._loaded_mtime = mtime
+        return True
+
+    def refresh(self, igdb=None):
+        '''
+            Fetches the taxonomies from IGDB in one request and writes them as a new snapshot version.
+        '''
+        igdb = default_client(priority=BACKGROUND, cache=False) if igdb is None else igdb
+        taxonomies = igdb.get_all_taxonomies()
+        snapshot = {
+            'version': self.version + 1,
+            'created_at': time.time()
+        }
+        snapshot.update({name: taxonomies[name] for name in taxonomy_names})
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path + '.tmp', 'w') as f:
+            json.dump(snapshot, f, sort_keys=True, indent=3)
+        os.replace(self.path + '.tmp', self.path)
+        self.load()
+
+    @property
+    def is_stale(self):
+        return time.time() - self.created_at > self.max_age
+
+    def get(self, name:str, igdb=None):
+        '''
+            returns the name -> id map of a taxonomy ("genres", "platforms" or "game_modes"),
+            fetching a first snapshot if there is none yet
+        '''
+        if name not in self.taxonomies:
+            self.refresh(igdb)
+        return self.taxonomies[name]
+
+    def _run(self, interval):
+        while True:
+            time.sleep(interval)
+            try:
+                if os.path.exists(self.path) and os.path.getmtime(self.path) != self._loaded_mtime:
+                    self.load()
+                if self.is_stale:
+                    self.refresh()
+            except Exception as e:
+                print('Error in taxonomy refresh:', e)
+
+    def start(self, interval=3600):
+        '''
+            Starts the background thread checking the snapshot every interval seconds; calling it again is a no-op.
+        '''
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, args=(interval,), name='taxonomy_refresh', daemon=True)
+                self._thread.start()
+        return self
+
+    def __repr__(self):
+        return f'Instance of TaxonomySnapshot class, path={self.path}, version={self.version}, created_at={self.created_at}'
+
+#Loaded at import, so that processes start with the taxonomies without asking IGDB
+snapshot = TaxonomySnapshot()
+snapshot.load()
+
+if __name__ == '__main__':
+    snapshot.refresh()
+    print(snapshot)
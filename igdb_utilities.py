@@ -83,6 +83,12 @@ multiplayer_field_map = {
     'splitscreen': 'Splitscreen'
     }
 
+involved_company_fields = '''
+    involved_companies.company.name,
+    involved_companies.developer,
+    involved_companies.publisher
+    '''
+
 company_fields = ''' description,
     developed.name,
     name,
@@ -99,45 +105,100 @@ def prompt_multiple_results(info):
                 results[title['name']] = title['id']
     return results
 
-def clean_game_info(info):
+_skip = object() #marks a field that is left out of the cleaned record
+
+def _join(values):
+    #Most lists have a single entry, which needs no deduplication or sorting
+    if len(values) < 2:
+        return '; '.join(values)
+    return '; '.join(sorted(set(values)))
+
+def _clean_named(value):
+    if isinstance(value, list):
+        return _join([sub_dict['name'] for sub_dict in value if isinstance(sub_dict, dict) and 'name' in sub_dict])
+    if isinstance(value, dict):
+        return value['name'] if 'name' in value else _skip
+    return value
+
+def _clean_human(value):
+    if isinstance(value, list):
+        return _join([sub_dict['human'] for sub_dict in value if isinstance(sub_dict, dict) and 'human' in sub_dict])
+    return _clean_generic(value)
+
+def _clean_age_ratings(value):
+    return _join([rating_category_enum[sub_dict['category']] + ' ' + rating_enum[sub_dict['rating']] for sub_dict in value if isinstance(sub_dict, dict)])
+
+def _clean_category(value):
+    return game_category_enum[value]
+
+def _clean_igdb_url(value):
+    return f'<a target="_blank" href="{value}">IGDB page</a>'
+
+def _clean_website_links(value):
+    if isinstance(value, list):
+        return _join([f'<a target="_blank" href="{sub_dict["url"]}">Company page</a>' for sub_dict in value if isinstance(sub_dict, dict) and 'url' in sub_dict])
+    return _clean_generic(value)
+
+def _clean_generic(value, list_keys=('name', 'human')):
+    #Fields without a dedicated cleaner: lists of objects are reduced to their first available key, objects to their name
+    if isinstance(value, list):
+        temp_value = []
+        for sub_dict in value:
+            if not isinstance(sub_dict, dict):
+                continue
+            for list_key in list_keys:
+                if list_key in sub_dict:
+                    temp_value.append(sub_dict[list_key])
+                    break
+        return _join(temp_value)
+    elif isinstance(value, dict):
+        return value['name'] if 'name' in value else _skip
+    return value
+
+def _field_cleaners(fields:str, special_cleaners:dict):
+    '''
+        Dispatch table from record key to cleaner, derived from the requested fields (e.g. "genres.name" -> _clean_named).
+    '''
+    subfield_cleaners = {'name': _clean_named, 'human': _clean_human}
+    cleaners = {}
+    for field in fields.split(','):
+        key, _, subfield = field.strip().partition('.')
+        if subfield in subfield_cleaners:
+            cleaners[key] = subfield_cleaners[subfield]
+    cleaners.update(special_cleaners)
+    return cleaners
+
+game_field_cleaners = _field_cleaners(game_fields, {'age_ratings': _clean_age_ratings, 'category': _clean_category, 'url': _clean_igdb_url})
+company_field_cleaners = _field_cleaners(company_fields, {'websites': _clean_website_links})
+
+def _clean_record(info, cleaners, generic):
     clean_info = {}
+    get_cleaner = cleaners.get
     for key, value in info.items():
-        temp_value = []
-        if isinstance(value, list):
-            for sub_dict in value:
-                if key == 'age_ratings':
-                    temp_value.append(rating_category_enum[sub_dict['category']] + ' ' + rating_enum[sub_dict['rating']])
-                elif 'name' in sub_dict.keys():
-                    temp_value.append(sub_dict['name'])
-                elif 'human' in sub_dict.keys():
-                    temp_value.append(sub_dict['human'])
-            clean_info[key] = '; '.join(sorted(list(set(temp_value))))
-        elif isinstance(value, dict):
-            if 'name' in value.keys():
-                clean_info[key] = value['name']
-        elif key == 'category':
-            clean_info[key] = game_category_enum[value]
-        elif key == 'url':
-            clean_info[key] = f'<a target="_blank" href="{value}">IGDB page</a>'
-        else:
-            clean_info[key] = value
-    
+        clean_value = get_cleaner(key, generic)(value)
+        if clean_value is not _skip:
+            clean_info[key] = clean_value
     return clean_info
 
+def _clean_company_generic(value):
+    return _clean_generic(value, list_keys=('name',))
+
+def clean_game_info_batch(records):
+    '''
+        Cleans raw game records from IGDB one at a time, as a generator (see clean_game_info).
+    '''
+    for info in records:
+        yield _clean_record(info, game_field_cleaners, _clean_generic)
+
+def clean_company_info_batch(records):
+    '''
+        Cleans raw company records from IGDB one at a time, as a generator (see clean_company_info).
+    '''
+    for info in records:
+        yield _clean_record(info, company_field_cleaners, _clean_company_generic)
+
+def clean_game_info(info):
+    return _clean_record(info, game_field_cleaners, _clean_generic)
+
 def clean_company_info(info):
-    clean_info = {}
-    for key, value in info.items():
-        temp_value = []
-        if isinstance(value, list):
-            for sub_dict in value:
-                if 'name' in sub_dict.keys():
-                    temp_value.append(sub_dict['name'])
-                elif 'url' in sub_dict.keys():
-                    temp_value.append(f'<a target="_blank" href="{sub_dict["url"]}">Company page</a>')
-            clean_info[key] = '; '.join(sorted(list(set(temp_value))))
-        elif isinstance(value, dict):
-            if 'name' in value.keys():
-                clean_info[key] = value['name']
-        else:
-            clean_info[key] = value
-    return clean_info
\ No newline at end of file
+    return _clean_record(info, company_field_cleaners, _clean_company_generic)
@@ -1,13 +1,8 @@
 ### LIBRARIES
-import os  
 import traceback
-import pandas as pd
 import numpy as np
 import copy
 import networkx
-from networkx.algorithms import community
-from networkx.algorithms import shortest_path
-from networkx.exception  import NetworkXNoPath
 #import matplotlib.pyplot as plt
 from bokeh.io import show, save
 from bokeh.models import Range1d, TapTool, BoxSelectTool, Circle, MultiLine, EdgesAndLinkedNodes, NodesAndLinkedEdges, CustomJS, Slider, Column
@@ -15,67 +10,67 @@ from bokeh.plotting import figure
 from bokeh.plotting import from_networkx
 from bokeh.palettes import Spectral11
 import streamlit as st
+from title_index import get_title_index
+from network_data import load_year, available_years
+from network_index import CompanyGameIndex, GameNameIndex
+from network_layout import layout_dict
+from network_community import load_communities
+from network_temporal import TemporalGraph
+from network_paths import PathIndex
 
 global_max_year = 2021
 
 st.set_page_config(page_title='pana$onic 2001 game network', page_icon='img/page_icon.jpg', layout='wide')
 
 ### DATA
-@st.cache(show_spinner=False)
-def _load_involved_companies(from_year):
-    tmp = []
-    for file in os.listdir('data/'):
-        if f'involved_companies_{from_year}' in file:
-            data = pd.read_csv(f'data/{file}', delimiter=';')
-            tmp.append(data)
-    df = pd.concat(tmp, ignore_index=True)
-    return df
+@st.cache(show_spinner=False, allow_output_mutation=True)
+def _load_network_data(from_year):
+    #Memory-mapped arrays, converted from the CSV files on first use
+    return load_year(from_year)
+
+@st.cache(show_spinner=False, allow_output_mutation=True)
+def _company_game_index(from_year):
+    return CompanyGameIndex(_load_network_data(from_year))
 
-@st.cache(show_spinner=False)
 def _get_company_games(from_year, companies):
-    games_df = _load_involved_companies(from_year)
-    games = []
-    for _, row in games_df.iterrows():
-        these_companies = set(row['companies'].split(','))
-        if set(these_companies).issuperset([str(c) for c in companies]):
-            games.append(row['game_name'])
-    return games
+    #Intersection of the companies' game arrays; works for any number of companies
+    return _company_game_index(from_year).shared_games(companies)
+
+@st.cache(show_spinner=False, allow_output_mutation=True)
+def _game_name_index(from_year):
+    return GameNameIndex(_load_network_data(from_year))
 
 def _get_game_companies(from_year, game_name):
-    company_df = _load_involved_companies(from_year)
-    company_ids = company_df[company_df['game_name'].str.match(game_name, case=False)]['companies'].values
+    if not game_name.strip():
+        return []
+    company_ids = _game_name_index(from_year).game_companies(game_name)
+    if len(company_ids) > 0:
+        return company_ids
+    #No game starts with the input; fall back to the best fuzzy title match
+    data = _load_network_data(from_year)
+    matches = get_title_index(from_year).search(game_name, k=1, min_similarity=0.5)
+    rows = np.nonzero(np.isin(data.game_ids, [m.id for m in matches]))[0]
+    company_ids = [data.game_companies(i) for i in rows]
     return company_ids
 
-
 @st.cache(show_spinner=False)
 def _get_edges(from_year):
-    #to_year = from_year + 1
-    edges_tmp = []
-    for file in os.listdir('data/'):
-        if f'company_edges_{from_year}' in file:
-            data = pd.read_csv(f'data/{file}', delimiter=';')
-            edges_tmp.append(data)
-    edges = pd.concat(edges_tmp, ignore_index=True)
-    edges.drop_duplicates(inplace=True)
-    return edges
+    return _load_network_data(from_year).edge_frame()
 
 @st.cache(show_spinner=False)
 def _get_node_names(from_year):
-    #to_year = from_year + 1
-    nodes_tmp = []
-    for file in os.listdir('data'):
-        if f'company_nodes_{from_year}' in file:
-            nodes_tmp.append(pd.read_csv(f'data/{file}', delimiter=';'))
-    nodes = pd.concat(nodes_tmp, ignore_index=True)
-    nodes.drop_duplicates(inplace=True)
-    ids = [id for id in nodes['id'].values]
-    names = [name for name in nodes['name'].values]
-    return dict(zip(ids, names))
+    return _load_network_data(from_year).node_dict()
 
 ### GRAPH
+@st.cache(show_spinner=False, allow_output_mutation=True)
+def _temporal_graph():
+    #One graph over all years; a year is a filtered view of it
+    return TemporalGraph({year: _load_network_data(year) for year in available_years()})
+
 @st.cache(allow_output_mutation=True)
-def _generate_network(edges):
-    G = networkx.from_pandas_edgelist(edges, 'source', 'target')
+def _generate_network(from_year):
+    #Copied, since node attributes of the year (names, degrees, communities) are set on it
+    G = _temporal_graph().view(from_year).copy()
     return G
 
 @st.cache(show_spinner=False, allow_output_mutation=True)
@@ -95,28 +90,34 @@ def _degree(G):
     return G, degrees
 
 @st.cache(show_spinner=False)
-def _community(G):
-    # Communities in network
-    communities = community.greedy_modularity_communities(G)
+def _community(from_year, algorithm='louvain'):
+    # Communities in network, detected once per year and algorithm and saved next to the year's data
+    # Louvain finds comparable or higher modularity than greedy modularity on these graphs, and is much faster (python network_community.py)
+    communities = load_communities(from_year, algorithm, _load_network_data(from_year))
     return communities
 
+@st.cache(show_spinner=False)
+def _get_layout(from_year):
+    #Computed once per year and saved next to the year's data
+    return layout_dict(from_year, _load_network_data(from_year), scale=10)
+
 @st.cache(show_spinner=False, allow_output_mutation=True)
 def _load_graph(from_year):
     edges = _get_edges(from_year)
     nodes = _get_node_names(from_year)
-    G = _generate_network(edges)
+    G = _generate_network(from_year)
     G = _set_node_names(G, nodes)
     G, degrees = _degree(G)
-    communities = _community(G)
+    communities = _community(from_year)
     return G, edges, nodes, degrees, communities
 
-def _find_shortest_path(G, source, target):
-    try:
-        shortest_p = shortest_path(G, source, target)
-    except NetworkXNoPath as e:
-        return e
-    else:
-        return shortest_p
+@st.cache(show_spinner=False, allow_output_mutation=True)
+def _path_index(from_year):
+    return PathIndex(_temporal_graph().view(from_year))
+
+def _find_shortest_paths(from_year, source, target, k=3):
+    #Up to k alternative paths, shortest first; empty if there is no path
+    return _path_index(from_year).k_shortest_paths(source, target, k)
 
 def _plot_network(from_year):
     
@@ -171,9 +172,8 @@ def _plot_network(from_year):
 
     plot.add_tools(TapTool(), BoxSelectTool())
     
-    #Create a network graph object with spring layout
-    # https://networkx.github.io/documentation/networkx-1.9/reference/generated/networkx.drawing.layout.spring_layout.html
-    network_graph = from_networkx(G, networkx.spring_layout, scale=10, center=(0, 0))
+    #Create a network graph object with the precomputed force layout of the year
+    network_graph = from_networkx(G, _get_layout(from_year))
 
     #Set node size and color
     network_graph.node_renderer.glyph = Circle(size=size_by_this_attribute, fill_color=color_by_this_attribute)
@@ -248,14 +248,17 @@ try:
             t = company_ids[sp_target] if sp_target in company_ids.keys() else None
             print(s, t)
             if all([s,t]):
-                shortest_path_tmp = _find_shortest_path(G, s, t)
-                if not isinstance(shortest_path_tmp, NetworkXNoPath):
-                    shortest_path_length = max(0,len(shortest_path_tmp)-2)
+                shortest_paths = _find_shortest_paths(from_year, s, t, k=3)
+                if len(shortest_paths) > 0:
+                    shortest_path_length = max(0,len(shortest_paths[0])-2)
                     st.markdown(f'*There are {shortest_path_length} companies between {sp_source} and {sp_target}*.')
-                    shortest_path = ' --> '.join([nodes[p] for p in shortest_path_tmp])
+                    shortest_path = ' --> '.join([nodes[p] for p in shortest_paths[0]])
                 else:
                     shortest_path = 'No path exists between these companies.'
                 st.markdown(shortest_path)
+                if len(shortest_paths) > 1:
+                    st.markdown('*Alternative paths:*')
+                    st.markdown('  \n'.join([' --> '.join([nodes[p] for p in path]) for path in shortest_paths[1:]]))
             else:
                 st.error('One or more of the companies were not found, or too few companies were submitted.')
         st.markdown('-------')
@@ -278,8 +281,7 @@ try:
         companies_game = st.text_input('Game name:')
         companies_ = _get_game_companies(from_year, companies_game)
         if len(companies_) > 0:
-            nodes_str_map = {str(k): v for k,v in nodes.items()}
-            company_names = '; '.join([nodes_str_map[c] for company in companies_ for c in company.split(',')])
+            company_names = '; '.join([nodes[c] for company in companies_ for c in company.tolist() if c in nodes])
             st.markdown(company_names)
         else:
             st.markdown('Game was not found. It could have been released another year.')
@@ -0,0 +1,98 @@
+import os
+import numpy as np
+import networkx
+from networkx.algorithms import community
+from network_data import NetworkData, load_year, available_years, _year_dir, _binary_dir
+
+#Louvain is in networkx from 2.7 on; with older versions the python-louvain package is used if installed
+try:
+    from networkx.algorithms.community import louvain_communities
+except ImportError:
+    try:
+        import community as community_louvain
+    except ImportError:
+        community_louvain = None
+
+    def louvain_communities(G, seed=None):
+        if community_louvain is None:
+            raise ImportError('Louvain community detection needs networkx>=2.7 or the python-louvain package')
+        partition = community_louvain.best_partition(G, random_state=seed)
+        communities = {}
+        for node, label in partition.items():
+            communities.setdefault(label, set()).add(node)
+        return list(communities.values())
+
+algorithms = {
+    'greedy_modularity': lambda G: community.greedy_modularity_communities(G),
+    'louvain': lambda G: louvain_communities(G, seed=0),
+    'label_propagation': lambda G: community.label_propagation_communities(G)
+}
+
+def graph(data:NetworkData):
+    G = networkx.Graph()
+    G.add_nodes_from(data.node_ids.tolist())
+    G.add_edges_from(data.edges.tolist())
+    return G
+
+def detect_communities(G, algorithm='louvain'):
+    '''
+        returns list of communities (sets of nodes), largest first
+    '''
+    if algorithm not in algorithms:
+        raise ValueError(f'Unknown community detection algorithm {algorithm}, choose one of {", ".join(algorithms)}')
+    return sorted([set(c) for c in algorithms[algorithm](G)], key=len, reverse=True)
+
+def _path(from_year, algorithm, binary_dir=_binary_dir):
+    return os.path.join(_year_dir(from_year, binary_dir), f'communities_{algorithm}.npy')
+
+def _is_current(from_year, algorithm, binary_dir=_binary_dir):
+    try:
+        return os.path.getmtime(_path(from_year, algorithm, binary_dir)) >= os.path.getmtime(os.path.join(_year_dir(from_year, binary_dir), 'meta.json'))
+    except OSError:
+        return False
+
+def load_communities(from_year, algorithm='louvain', data:NetworkData=None, binary_dir=_binary_dir):
+    '''
+        Loads the communities of a year found with an algorithm, detecting and saving them under binary_dir/<from_year>/ if needed.
+        returns list of communities (sets of company ids), largest first
+    '''
+    path = _path(from_year, algorithm, binary_dir)
+    if _is_current(from_year, algorithm, binary_dir):
+        #Rows of (company id, community number)
+        labels = np.load(path)
+        communities = [set() for _ in range(labels[:, 1].max()+1)] if len(labels) else []
+        for node, label in labels.tolist():
+            communities[label].add(node)
+        return communities
+
+    data = load_year(from_year, binary_dir=binary_dir) if data is None else data
+    communities = detect_communities(graph(data), algorithm)
+    labels = np.array([(node, label) for label, c in enumerate(communities) for node in c], dtype=np.int64).reshape(-1, 2)
+    np.save(path, labels)
+    return communities
+
+def benchmark(years=None, algorithm_names=None):
+    '''
+        Runs every algorithm on every year's graph; returns list of (year, algorithm, seconds, number of communities, modularity).
+    '''
+    import time
+    years = available_years() if years is None else years
+    algorithm_names = list(algorithms) if algorithm_names is None else algorithm_names
+    results = []
+    for year in years:
+        G = graph(load_year(year))
+        for algorithm in algorithm_names:
+            start = time.perf_counter()
+            try:
+                communities = detect_communities(G, algorithm)
+            except ImportError as e:
+                print(e)
+                continue
+            seconds = time.perf_counter() - start
+            results.append((year, algorithm, seconds, len(communities), community.modularity(G, communities)))
+    return results
+
+if __name__ == '__main__':
+    print(f'{"year":<6}{"algorithm":<20}{"seconds":>9}{"communities":>13}{"modularity":>12}')
+    for year, algorithm, seconds, n_communities, modularity in benchmark():
+        print(f'{year:<6}{algorithm:<20}{seconds:>9.3f}{n_communities:>13}{modularity:>12.4f}')
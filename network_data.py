@@ -0,0 +1,111 @@
+import os
+import json
+import numpy as np
+import pandas as pd
+
+_data_dir = 'data'
+_binary_dir = os.path.join('data', 'binary')
+
+#Arrays stored per year; all are plain .npy files, loaded memory-mapped
+_array_names = ('node_ids', 'node_names', 'edges', 'game_ids', 'game_names', 'game_ratings', 'game_years', 'company_offsets', 'companies')
+
+class NetworkData:
+
+    '''
+        Company network of one year as numpy arrays.
+
+        node_ids, node_names: companies in the network
+        edges: (n, 2) array of collaborating company id pairs, without duplicates
+        game_ids, game_names, game_ratings, game_years: one entry per involved_companies row
+        companies, company_offsets: exploded game -> company table in CSR layout;
+            the company ids of game i are companies[company_offsets[i]:company_offsets[i+1]]
+    '''
+
+    def __init__(self, from_year, arrays):
+        self.from_year = from_year
+        for name in _array_names:
+            setattr(self, name, arrays[name])
+
+    def game_companies(self, i):
+        return self.companies[self.company_offsets[i]:self.company_offsets[i+1]]
+
+    def node_dict(self):
+        return dict(zip(self.node_ids.tolist(), self.node_names.tolist()))
+
+    def edge_frame(self):
+        return pd.DataFrame({'source': self.edges[:, 0], 'target': self.edges[:, 1]})
+
+    def __repr__(self):
+        return f'Instance of NetworkData class, from_year={self.from_year}, nodes={len(self.node_ids)}, edges={len(self.edges)}, games={len(self.game_ids)}'
+
+def _source_files(from_year, data_dir=_data_dir):
+    return {kind: os.path.join(data_dir, f'{kind}_{from_year}_to_{from_year+1}.csv') for kind in ('company_nodes', 'company_edges', 'involved_companies')}
+
+def _year_dir(from_year, binary_dir=_binary_dir):
+    return os.path.join(binary_dir, str(from_year))
+
+def convert_year(from_year, data_dir=_data_dir, binary_dir=_binary_dir):
+    '''
+        Converts the semicolon separated CSV files of a year into .npy arrays under binary_dir/<from_year>/.
+    '''
+    sources = _source_files(from_year, data_dir)
+    nodes = pd.read_csv(sources['company_nodes'], delimiter=';').drop_duplicates()
+    edges = pd.read_csv(sources['company_edges'], delimiter=';').drop_duplicates()
+    games = pd.read_csv(sources['involved_companies'], delimiter=';', dtype={'companies': str})
+
+    company_lists = [[int(c) for c in str(companies).split(',') if c] for companies in games['companies'].fillna('')]
+    company_offsets = np.zeros(len(company_lists) + 1, dtype=np.int64)
+    company_offsets[1:] = np.cumsum([len(c) for c in company_lists])
+
+    arrays = {
+        'node_ids': nodes['id'].values.astype(np.int32),
+        'node_names': np.array(nodes['name'].fillna('').astype(str).tolist(), dtype=str),
+        'edges': edges[['source', 'target']].values.astype(np.int32),
+        'game_ids': games['game_id'].values.astype(np.int32),
+        'game_names': np.array(games['game_name'].fillna('').astype(str).tolist(), dtype=str),
+        'game_ratings': games['rating'].values.astype(np.float32),
+        'game_years': games['year'].values.astype(np.int16),
+        'company_offsets': company_offsets,
+        'companies': np.array([c for companies in company_lists for c in companies], dtype=np.int32)
+    }
+
+    year_dir = _year_dir(from_year, binary_dir)
+    os.makedirs(year_dir, exist_ok=True)
+    for name, array in arrays.items():
+        np.save(os.path.join(year_dir, f'{name}.npy'), array)
+    #Written last, so a conversion interrupted halfway is redone
+    meta = {'from_year': from_year, 'sources': {kind: os.path.getmtime(path) for kind, path in sources.items()}}
+    with open(os.path.join(year_dir, 'meta.json'), 'w') as f:
+        json.dump(meta, f, indent=3)
+    return NetworkData(from_year, arrays)
+
+def _is_current(from_year, data_dir=_data_dir, binary_dir=_binary_dir):
+    try:
+        with open(os.path.join(_year_dir(from_year, binary_dir), 'meta.json'), 'r') as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return False
+    sources = _source_files(from_year, data_dir)
+    return all([meta['sources'].get(kind) == os.path.getmtime(path) for kind, path in sources.items() if os.path.exists(path)])
+
+def load_year(from_year, data_dir=_data_dir, binary_dir=_binary_dir):
+    '''
+        Loads the network data of a year memory-mapped, converting it from CSV first if needed.
+        Raises FileNotFoundError if there is no data for the year.
+    '''
+    if not _is_current(from_year, data_dir, binary_dir):
+        return convert_year(from_year, data_dir, binary_dir)
+    year_dir = _year_dir(from_year, binary_dir)
+    arrays = {name: np.load(os.path.join(year_dir, f'{name}.npy'), mmap_mode='r') for name in _array_names}
+    return NetworkData(from_year, arrays)
+
+def available_years(data_dir=_data_dir):
+    years = []
+    for file in os.listdir(data_dir):
+        if file.startswith('company_edges_') and file.endswith('.csv'):
+            years.append(int(file.split('_')[2]))
+    return sorted(years)
+
+if __name__ == '__main__':
+    for year in available_years():
+        print(convert_year(year))
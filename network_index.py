@@ -0,0 +1,90 @@
+import numpy as np
+from network_data import NetworkData
+
+class CompanyGameIndex:
+
+    '''
+        Inverted company -> games index of one year.
+
+        The games of every company are kept as a sorted array of game rows (CSR layout), so the games a set of companies
+        worked on together is the intersection of their arrays.
+    '''
+
+    def __init__(self, data:NetworkData):
+        self.data = data
+        game_rows = np.repeat(np.arange(len(data.game_ids), dtype=np.int32), np.diff(data.company_offsets))
+        companies = np.asarray(data.companies, dtype=np.int64)
+        #Unique (company, game row) pairs, sorted by company and then game row
+        pairs = np.unique(companies*len(data.game_ids) + game_rows) if len(companies) else np.zeros(0, dtype=np.int64)
+        sorted_companies = pairs//max(len(data.game_ids), 1)
+        self.game_rows = (pairs % max(len(data.game_ids), 1)).astype(np.int32)
+        self.company_ids, self.starts = np.unique(sorted_companies, return_index=True)
+        self.ends = np.append(self.starts[1:], len(pairs))
+
+    def company_game_rows(self, company_id):
+        '''
+            returns sorted array of the game rows the company is involved in
+        '''
+        i = np.searchsorted(self.company_ids, company_id)
+        if i == len(self.company_ids) or self.company_ids[i] != company_id:
+            return self.game_rows[:0]
+        return self.game_rows[self.starts[i]:self.ends[i]]
+
+    def shared_game_rows(self, company_ids):
+        '''
+            returns sorted array of the game rows all the companies are involved in
+        '''
+        postings = sorted([self.company_game_rows(int(c)) for c in set(company_ids)], key=len)
+        if not postings:
+            return self.game_rows[:0]
+        rows = postings[0]
+        for posting in postings[1:]:
+            if len(rows) == 0:
+                break
+            rows = np.intersect1d(rows, posting, assume_unique=True)
+        return rows
+
+    def shared_games(self, company_ids):
+        '''
+            returns names of the games all the companies worked on together
+        '''
+        return [str(name) for name in self.data.game_names[self.shared_game_rows(company_ids)]]
+
+def normalize_game_name(name:str):
+    return ' '.join(str(name).casefold().split())
+
+class GameNameIndex:
+
+    '''
+        Case-folded prefix index over the game names of one year.
+
+        Names are normalized (case-folded, whitespace collapsed) and kept sorted, so the games starting with a prefix are one
+        contiguous range found with two binary searches. The prefix is compared literally, not as a pattern.
+    '''
+
+    #Sorts after every character, so prefix + _max_char bounds all names starting with prefix
+    _max_char = '\U0010ffff'
+
+    def __init__(self, data:NetworkData):
+        self.data = data
+        names = np.array([normalize_game_name(name) for name in data.game_names.tolist()], dtype=str)
+        order = np.argsort(names, kind='stable')
+        self.names = names[order]
+        self.game_rows = order.astype(np.int32)
+
+    def prefix_game_rows(self, prefix:str):
+        '''
+            returns sorted array of the game rows whose name starts with prefix; nothing for an empty prefix
+        '''
+        prefix = normalize_game_name(prefix)
+        if not prefix:
+            return self.game_rows[:0]
+        start = np.searchsorted(self.names, prefix, side='left')
+        end = np.searchsorted(self.names, prefix + self._max_char, side='left')
+        return np.sort(self.game_rows[start:end])
+
+    def game_companies(self, prefix:str):
+        '''
+            returns list of company id arrays, one per game row matching the prefix
+        '''
+        return [self.data.game_companies(i) for i in self.prefix_game_rows(prefix)]
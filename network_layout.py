@@ -0,0 +1,140 @@
+import os
+import numpy as np
+from network_data import NetworkData, load_year, available_years, _year_dir, _binary_dir
+
+_layout_names = ('layout_nodes', 'layout_positions')
+
+def fruchterman_reingold(n_nodes, edges, init_pos=None, iterations=50, temperature=0.1, chunk_size=512, seed=0):
+    '''
+        Vectorized Fruchterman-Reingold force layout.
+
+        :n_nodes: number of nodes
+        :edges: (m, 2) array of node indices (not ids)
+        :init_pos: optional (n_nodes, 2) start positions; random positions are used otherwise
+        :temperature: largest step of a node in the first iteration, cooled linearly to zero
+        :chunk_size: number of nodes whose repulsion is computed at once; bounds memory to chunk_size*n_nodes pairs
+        returns (n_nodes, 2) array of positions
+    '''
+    rng = np.random.RandomState(seed)
+    pos = rng.random_sample((n_nodes, 2)) if init_pos is None else np.array(init_pos, dtype=np.float64)
+    if n_nodes < 2:
+        return pos
+    edges = np.asarray(edges, dtype=np.int64).reshape(-1, 2)
+    source, target = edges[:, 0], edges[:, 1]
+    #Optimal distance between nodes
+    k = np.sqrt(1.0/n_nodes)
+    dt = temperature/(iterations+1)
+
+    for _ in range(iterations):
+        displacement = np.zeros((n_nodes, 2))
+        #Repulsion between all node pairs, one block of rows at a time
+        x, y = pos[:, 0], pos[:, 1]
+        for start in range(0, n_nodes, chunk_size):
+            dx = x[start:start+chunk_size, None] - x[None, :]
+            dy = y[start:start+chunk_size, None] - y[None, :]
+            weight = (k*k) / np.maximum(dx*dx + dy*dy, 1e-4)
+            displacement[start:start+chunk_size, 0] += (dx*weight).sum(axis=1)
+            displacement[start:start+chunk_size, 1] += (dy*weight).sum(axis=1)
+        #Attraction along edges
+        delta = pos[source] - pos[target]
+        distance = np.maximum(np.sqrt((delta**2).sum(axis=1)), 1e-2)
+        force = delta * (distance/k)[:, None]
+        for axis in range(2):
+            displacement[:, axis] -= np.bincount(source, weights=force[:, axis], minlength=n_nodes)
+            displacement[:, axis] += np.bincount(target, weights=force[:, axis], minlength=n_nodes)
+        #Move every node at most `temperature` along its displacement
+        length = np.maximum(np.sqrt((displacement**2).sum(axis=1)), 1e-2)
+        pos += displacement * (temperature/length)[:, None]
+        temperature -= dt
+    return pos
+
+def rescale(pos, scale=10):
+    '''
+        Centers positions at the origin and scales them to [-scale, scale].
+    '''
+    pos = pos - pos.mean(axis=0)
+    extent = np.abs(pos).max()
+    return pos * (scale/extent) if extent > 0 else pos
+
+def _warm_start(data:NetworkData, previous_nodes, previous_positions, seed=0):
+    '''
+        Start positions for a year from the previous year's layout: companies already placed keep their position,
+        new companies start at the mean position of their placed collaborators (or at random if there are none).
+    '''
+    rng = np.random.RandomState(seed)
+    node_ids = np.asarray(data.node_ids)
+    pos = rng.random_sample((len(node_ids), 2))
+    order = np.argsort(previous_nodes)
+    i = np.minimum(np.searchsorted(previous_nodes, node_ids, sorter=order), len(previous_nodes)-1)
+    placed = previous_nodes[order[i]] == node_ids
+    pos[placed] = previous_positions[order[i[placed]]]
+
+    edges = _edge_indices(data)
+    source = np.concatenate([edges[:, 0], edges[:, 1]])
+    target = np.concatenate([edges[:, 1], edges[:, 0]])
+    #Only edges from placed to new nodes count
+    mask = placed[source] & ~placed[target]
+    counts = np.bincount(target[mask], minlength=len(node_ids))
+    new_with_neighbours = (counts > 0) & ~placed
+    for axis in range(2):
+        sums = np.bincount(target[mask], weights=pos[source[mask], axis], minlength=len(node_ids))
+        pos[new_with_neighbours, axis] = sums[new_with_neighbours]/counts[new_with_neighbours]
+    return pos, placed
+
+def _edge_indices(data:NetworkData):
+    order = np.argsort(data.node_ids)
+    return order[np.searchsorted(data.node_ids, np.asarray(data.edges), sorter=order)].reshape(-1, 2)
+
+def compute_layout(data:NetworkData, previous=None, iterations=50, seed=0):
+    '''
+        Computes the layout of a year, warm-started from the previous year's layout if given.
+        :previous: tuple (node ids, positions) of the previous year
+        returns (n_nodes, 2) array of positions in the order of data.node_ids
+    '''
+    edges = _edge_indices(data)
+    if previous is None:
+        return fruchterman_reingold(len(data.node_ids), edges, iterations=iterations, seed=seed)
+    init_pos, _ = _warm_start(data, *previous, seed=seed)
+    #Most companies are already in place, so a cooler and shorter run only settles the new ones
+    return fruchterman_reingold(len(data.node_ids), edges, init_pos=init_pos, iterations=iterations//2, temperature=0.05, seed=seed)
+
+def _is_current(from_year, binary_dir=_binary_dir):
+    year_dir = _year_dir(from_year, binary_dir)
+    try:
+        layout_mtime = min([os.path.getmtime(os.path.join(year_dir, f'{name}.npy')) for name in _layout_names])
+        return layout_mtime >= os.path.getmtime(os.path.join(year_dir, 'meta.json'))
+    except OSError:
+        return False
+
+def load_layout(from_year, data:NetworkData=None, binary_dir=_binary_dir):
+    '''
+        Loads the layout of a year as tuple (node ids, positions), computing and saving it under binary_dir/<from_year>/
+        if needed. Years are laid out in order, each starting from the one before, so companies keep their place on the map.
+    '''
+    data = load_year(from_year, binary_dir=binary_dir) if data is None else data
+    year_dir = _year_dir(from_year, binary_dir)
+    if _is_current(from_year, binary_dir):
+        return tuple(np.load(os.path.join(year_dir, f'{name}.npy')) for name in _layout_names)
+
+    previous = None
+    if from_year-1 in available_years():
+        previous = load_layout(from_year-1, binary_dir=binary_dir)
+    positions = compute_layout(data, previous)
+    node_ids = np.asarray(data.node_ids)
+    for name, array in zip(_layout_names, (node_ids, positions)):
+        np.save(os.path.join(year_dir, f'{name}.npy'), array)
+    return node_ids, positions
+
+def layout_dict(from_year, data:NetworkData=None, scale=10):
+    '''
+        returns dict node id -> (x, y) scaled to [-scale, scale], as taken by bokeh's from_networkx
+    '''
+    node_ids, positions = load_layout(from_year, data)
+    return dict(zip(node_ids.tolist(), rescale(positions, scale).tolist()))
+
+if __name__ == '__main__':
+    import time
+    for year in available_years():
+        start = time.time()
+        node_ids, positions = load_layout(year)
+        print(year, len(node_ids), f'{time.time()-start:.2f}s')
@@ -0,0 +1,203 @@
+import heapq
+import numpy as np
+
+class PathIndex:
+
+    '''
+        Path queries on an unweighted company graph.
+
+        The graph is kept as a compact adjacency (CSR layout: the neighbours of node i are indices[indptr[i]:indptr[i+1]]),
+        searched from both ends level by level with numpy. A few landmark nodes with precomputed BFS distances give O(1)
+        distance bounds (see distance_bounds); path queries use them to answer "no path" between components without a search.
+    '''
+
+    def __init__(self, G, n_landmarks=8):
+        '''
+            :G: networkx graph (or view) with integer nodes
+            :n_landmarks: number of highest degree nodes used as landmarks
+        '''
+        self.nodes = np.array(sorted(G.nodes()), dtype=np.int64)
+        n = len(self.nodes)
+        edges = np.array([(u, v) for u, v in G.edges() if u != v], dtype=np.int64).reshape(-1, 2)
+        edges = np.searchsorted(self.nodes, edges)
+        #Both directions, sorted by source and then target so every row is sorted
+        source = np.concatenate([edges[:, 0], edges[:, 1]])
+        target = np.concatenate([edges[:, 1], edges[:, 0]])
+        order = np.lexsort((target, source))
+        self.indices = target[order].astype(np.int32)
+        self.indptr = np.zeros(n+1, dtype=np.int64)
+        self.indptr[1:] = np.cumsum(np.bincount(source, minlength=n))
+        degrees = np.diff(self.indptr)
+        self.landmarks = np.argsort(-degrees, kind='stable')[:min(n_landmarks, n)]
+        self.landmark_distances = np.array([self._bfs(l) for l in self.landmarks], dtype=np.int32).reshape(len(self.landmarks), n)
+
+    def _index(self, node):
+        i = np.searchsorted(self.nodes, node)
+        if i == len(self.nodes) or self.nodes[i] != node:
+            raise KeyError(f'{node} is not in the graph')
+        return int(i)
+
+    def _expand(self, frontier, blocked_edges=None):
+        '''
+            returns arrays (from node, to node) of all edges leaving the frontier, without blocked edge positions
+        '''
+        starts = self.indptr[frontier]
+        lengths = self.indptr[frontier+1] - starts
+        positions = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        sources = np.repeat(frontier, lengths)
+        if blocked_edges is not None:
+            keep = ~blocked_edges[positions]
+            positions, sources = positions[keep], sources[keep]
+        return sources, self.indices[positions]
+
+    def _bfs(self, source):
+        distances = np.full(len(self.nodes), -1, dtype=np.int32)
+        distances[source] = 0
+        frontier = np.array([source])
+        level = 0
+        while len(frontier):
+            level += 1
+            _, neighbours = self._expand(frontier)
+            frontier = np.unique(neighbours[distances[neighbours] == -1])
+            distances[frontier] = level
+        return distances
+
+    def distances_from(self, source):
+        '''
+            returns dict company id -> number of steps from source, for every company reachable from it
+        '''
+        distances = self._bfs(self._index(source))
+        reachable = np.nonzero(distances >= 0)[0]
+        return dict(zip(self.nodes[reachable].tolist(), distances[reachable].tolist()))
+
+    def distance_matrix(self, sources):
+        '''
+            returns (len(sources), n) array of steps from each source to every company in self.nodes, -1 where unreachable
+        '''
+        return np.array([self._bfs(self._index(s)) for s in sources], dtype=np.int32).reshape(len(sources), len(self.nodes))
+
+    def _bounds(self, s, t):
+        ds, dt = self.landmark_distances[:, s], self.landmark_distances[:, t]
+        if np.any((ds >= 0) != (dt >= 0)):
+            #One of them is in a landmark's component and the other is not
+            return np.inf, np.inf
+        both = (ds >= 0) & (dt >= 0)
+        if not np.any(both):
+            return 0, np.inf
+        return int(np.abs(ds[both] - dt[both]).max()), int((ds[both] + dt[both]).min())
+
+    def distance_bounds(self, source, target):
+        '''
+            returns tuple (lower, upper) bound on the number of steps between two companies; (inf, inf) if there is no path
+        '''
+        return self._bounds(self._index(source), self._index(target))
+
+    def _shortest_path(self, s, t, blocked_nodes=None, blocked_edges=None):
+        '''
+            Bidirectional BFS between node indices; returns list of node indices or None
+        '''
+        if s == t:
+            return [s]
+        n = len(self.nodes)
+        parents = (np.full(n, -1, dtype=np.int64), np.full(n, -1, dtype=np.int64))
+        distances = (np.full(n, -1, dtype=np.int32), np.full(n, -1, dtype=np.int32))
+        frontiers = [np.array([s]), np.array([t])]
+        for side, node in enumerate((s, t)):
+            parents[side][node] = node
+            distances[side][node] = 0
+        while len(frontiers[0]) and len(frontiers[1]):
+            #Expand the smaller side by one level
+            side = 0 if len(frontiers[0]) <= len(frontiers[1]) else 1
+            other = 1 - side
+            sources, neighbours = self._expand(frontiers[side], blocked_edges)
+            new = distances[side][neighbours] == -1
+            if blocked_nodes is not None:
+                new &= ~blocked_nodes[neighbours]
+            sources, neighbours = sources[new], neighbours[new]
+            neighbours, first = np.unique(neighbours, return_index=True)
+            sources = sources[first]
+            parents[side][neighbours] = sources
+            distances[side][neighbours] = distances[side][sources] + 1
+            meeting = neighbours[distances[other][neighbours] >= 0]
+            if len(meeting):
+                middle = meeting[np.argmin(distances[other][meeting])]
+                halves = []
+                for half in (0, 1):
+                    path, node = [], middle
+                    while node != parents[half][node]:
+                        path.append(int(node))
+                        node = parents[half][node]
+                    path.append(int(node))
+                    halves.append(path)
+                return halves[0][::-1] + halves[1][1:]
+            frontiers[side] = neighbours
+        return None
+
+    def shortest_path(self, source, target):
+        '''
+            returns list of company ids on a shortest path from source to target, or None if there is none
+        '''
+        s, t = self._index(source), self._index(target)
+        if self._bounds(s, t)[0] == np.inf:
+            return None
+        path = self._shortest_path(s, t)
+        return None if path is None else self.nodes[path].tolist()
+
+    def _edge_positions(self, u, v):
+        positions = []
+        for a, b in ((u, v), (v, u)):
+            start, end = self.indptr[a], self.indptr[a+1]
+            positions.append(start + np.searchsorted(self.indices[start:end], b))
+        return positions
+
+    def k_shortest_paths(self, source, target, k=3):
+        '''
+            returns list of up to k loopless paths (lists of company ids) from source to target, shortest first (Yen's algorithm)
+        '''
+        s, t = self._index(source), self._index(target)
+        if self._bounds(s, t)[0] == np.inf:
+            return []
+        first = self._shortest_path(s, t)
+        if first is None:
+            return []
+        paths = [first]
+        candidates = []
+        seen = {tuple(first)}
+        blocked_nodes = np.zeros(len(self.nodes), dtype=bool)
+        blocked_edges = np.zeros(len(self.indices), dtype=bool)
+        while len(paths) < k:
+            previous = paths[-1]
+            for i in range(len(previous)-1):
+                spur, root = previous[i], previous[:i+1]
+                #Edges leaving the root in the paths found so far, and the root nodes before the spur node, are not used again
+                blocked_edges[:] = False
+                for path in paths:
+                    if path[:i+1] == root:
+                        blocked_edges[self._edge_positions(path[i], path[i+1])] = True
+                blocked_nodes[:] = False
+                blocked_nodes[root[:-1]] = True
+                spur_path = self._shortest_path(spur, t, blocked_nodes, blocked_edges)
+                if spur_path is not None:
+                    candidate = root[:-1] + spur_path
+                    if tuple(candidate) not in seen:
+                        seen.add(tuple(candidate))
+                        heapq.heappush(candidates, (len(candidate), candidate))
+            if not candidates:
+                break
+            paths.append(heapq.heappop(candidates)[1])
+        return [self.nodes[path].tolist() for path in paths]
+
+    def __repr__(self):
+        return f'Instance of PathIndex class, nodes={len(self.nodes)}, edges={len(self.indices)//2}, landmarks={len(self.landmarks)}'
+
+if __name__ == '__main__':
+    import time
+    from network_temporal import TemporalGraph
+    temporal_graph = TemporalGraph.from_years()
+    start = time.perf_counter()
+    index = PathIndex(temporal_graph.view(temporal_graph.years[0], temporal_graph.years[-1]))
+    print(index, f'built in {time.perf_counter()-start:.3f}s')
+    source, target = index.nodes[index.landmarks[0]], index.nodes[-1]
+    start = time.perf_counter()
+    paths = index.k_shortest_paths(source, target, k=3)
+    print(paths, f'{time.perf_counter()-start:.4f}s')
@@ -0,0 +1,84 @@
+import numpy as np
+import pandas as pd
+import networkx
+from network_data import load_year, available_years
+
+class TemporalGraph:
+
+    '''
+        One company graph over all years.
+
+        Nodes are IGDB company ids, which are the same in every year. Every node and edge has a 'years' bitmask with bit
+        (year - first_year) set for each year it appears in, so a year or range of years is a filtered view of the one graph
+        (see view) instead of a graph of its own.
+    '''
+
+    def __init__(self, data_by_year:dict):
+        '''
+            :data_by_year: dict from_year -> NetworkData
+        '''
+        self.years = sorted(data_by_year)
+        self.first_year = self.years[0] if self.years else 0
+        self.graph = networkx.Graph()
+        for year in self.years:
+            data = data_by_year[year]
+            bit = self.year_mask(year)
+            for node, name in zip(data.node_ids.tolist(), data.node_names.tolist()):
+                if node in self.graph:
+                    self.graph.nodes[node]['years'] |= bit
+                    #Later years win, so a company is shown with its latest name
+                    self.graph.nodes[node]['name'] = name
+                else:
+                    self.graph.add_node(node, years=bit, name=name)
+            for source, target in data.edges.tolist():
+                for node in (source, target):
+                    if node not in self.graph:
+                        self.graph.add_node(node, years=0, name=str(node))
+                    self.graph.nodes[node]['years'] |= bit
+                if self.graph.has_edge(source, target):
+                    self.graph[source][target]['years'] |= bit
+                else:
+                    self.graph.add_edge(source, target, years=bit)
+
+    @classmethod
+    def from_years(cls, years=None):
+        years = available_years() if years is None else years
+        return cls({year: load_year(year) for year in years})
+
+    def year_mask(self, from_year, to_year=None):
+        '''
+            returns bitmask of the years from_year to to_year (both included; only from_year if to_year is None)
+        '''
+        to_year = from_year if to_year is None else to_year
+        mask = 0
+        for year in range(max(from_year, self.first_year), to_year+1):
+            mask |= 1 << (year - self.first_year)
+        return mask
+
+    def view(self, from_year, to_year=None):
+        '''
+            Read-only view of the companies and collaborations of the years from_year to to_year (both included).
+            The view shares its node and edge attributes with the full graph: copy it before setting attributes.
+        '''
+        mask = self.year_mask(from_year, to_year)
+        nodes, edges = self.graph.nodes, self.graph.edges
+        return networkx.subgraph_view(self.graph,
+                                      filter_node=lambda node: nodes[node]['years'] & mask,
+                                      filter_edge=lambda source, target: edges[source, target]['years'] & mask)
+
+    def node_dict(self, from_year, to_year=None):
+        return dict(self.view(from_year, to_year).nodes(data='name'))
+
+    def edge_frame(self, from_year, to_year=None):
+        edges = np.array(list(self.view(from_year, to_year).edges()), dtype=np.int32).reshape(-1, 2)
+        return pd.DataFrame({'source': edges[:, 0], 'target': edges[:, 1]})
+
+    def __repr__(self):
+        return f'Instance of TemporalGraph class, years={self.years}, nodes={self.graph.number_of_nodes()}, edges={self.graph.number_of_edges()}'
+
+if __name__ == '__main__':
+    temporal_graph = TemporalGraph.from_years()
+    print(temporal_graph)
+    for year in temporal_graph.years:
+        G = temporal_graph.view(year)
+        print(year, G.number_of_nodes(), G.number_of_edges())
@@ -0,0 +1,185 @@
+import os
+import re
+import csv
+import pickle
+import threading
+import numpy as np
+from collections import namedtuple
+
+_default_path = os.environ.get('TITLE_INDEX_PATH', 'cache/title_index.pkl')
+_non_alphanumeric = re.compile(r'[^\w]+')
+
+TitleMatch = namedtuple('TitleMatch', ['id', 'name', 'similarity', 'rating'])
+
+def normalize_title(title:str):
+    return ' '.join(_non_alphanumeric.sub(' ', title.casefold()).split())
+
+def trigrams(title:str):
+    '''
+        Trigrams of each word padded with two leading and one trailing space, so short words and word starts count as well.
+    '''
+    grams = set()
+    for word in normalize_title(title).split():
+        padded = f'  {word} '
+        grams.update(padded[i:i+3] for i in range(len(padded)-2))
+    return grams
+
+class TitleIndex:
+
+    '''
+        In-process fuzzy title search: trigram inverted index ranked by trigram similarity, then by rating.
+
+        Similarity is the Tversky index of the query and title trigrams, weighing trigrams missing from the title fully
+        and extra title trigrams by a quarter, so that a query matches long titles containing it.
+    '''
+
+    _version = 1
+    _extra_trigram_weight = 0.25
+
+    def __init__(self):
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.names = []
+        self.ratings = np.zeros(0, dtype=np.float64)
+        self.trigram_counts = np.zeros(0, dtype=np.int32)
+        self.postings = {}
+        self.source = None
+        self.source_version = None #state of the source data the index was built from, see _load_or_build
+
+    @classmethod
+    def from_records(cls, records, source=None):
+        '''
+            :records: iterable of (id, name, rating) tuples; rating may be None. The highest rated record of an id is kept.
+        '''
+        unique = {}
+        for game_id, name, rating in records:
+            rating = float(rating) if rating not in (None, '') else 0.0
+            if game_id not in unique or rating > unique[game_id][1]:
+                unique[game_id] = (name, rating)
+
+        index = cls()
+        index.source = source
+        ids, ratings, trigram_counts, postings = [], [], [], {}
+        for position, (game_id, (name, rating)) in enumerate(unique.items()):
+            grams = trigrams(name)
+            ids.append(int(game_id))
+            index.names.append(name)
+            ratings.append(rating)
+            trigram_counts.append(len(grams))
+            for gram in grams:
+                postings.setdefault(gram, []).append(position)
+        index.ids = np.array(ids, dtype=np.int64)
+        index.ratings = np.array(ratings, dtype=np.float64)
+        index.trigram_counts = np.array(trigram_counts, dtype=np.int32)
+        index.postings = {gram: np.array(positions, dtype=np.int32) for gram, positions in postings.items()}
+        return index
+
+    @classmethod
+    def from_involved_companies(cls, from_year=None, data_dir='data'):
+        '''
+            Builds the index from the involved_companies CSV files (all years unless from_year is given).
+        '''
+        def records():
+            for file in sorted(os.listdir(data_dir)):
+                if file.startswith('involved_companies_') and (from_year is None or f'involved_companies_{from_year}' in file):
+                    with open(os.path.join(data_dir, file), newline='', encoding='utf-8') as f:
+                        for row in csv.DictReader(f, delimiter=';'):
+                            yield int(row['game_id']), row['game_name'], row['rating']
+        return cls.from_records(records(), source=f'involved_companies_{from_year or "all"}')
+
+    @classmethod
+    def from_mirror(cls, mirror):
+        '''
+            Builds the index from the games of an igdb_mirror.IGDBMirror.
+        '''
+        with mirror._lock:
+            rows = mirror._connection.execute("SELECT id, name, rating FROM records WHERE endpoint = 'games' AND name IS NOT NULL").fetchall()
+        return cls.from_records(rows, source=mirror.path)
+
+    def search(self, query:str, k=10, min_similarity=0.3):
+        '''
+            returns up to k TitleMatch tuples, most similar first (ties broken by rating)
+        '''
+        query_grams = trigrams(query)
+        postings = [self.postings[gram] for gram in query_grams if gram in self.postings]
+        if not postings:
+            return []
+
+        #Overlap of every title sharing a trigram with the query, counted in one pass
+        overlaps = np.bincount(np.concatenate(postings), minlength=len(self.ids))
+        candidates = np.nonzero(overlaps)[0]
+        overlap = overlaps[candidates]
+        similarity = overlap/(len(query_grams) + self._extra_trigram_weight*(self.trigram_counts[candidates] - overlap))
+        keep = similarity >= min_similarity
+        candidates, similarity = candidates[keep], similarity[keep]
+        if len(candidates) > k:
+            top = np.argpartition(-similarity, k-1)[:k]
+            candidates, similarity = candidates[top], similarity[top]
+        order = np.lexsort((-self.ratings[candidates], -similarity))
+
+        return [TitleMatch(int(self.ids[p]), self.names[p], round(float(s), 3), float(self.ratings[p])) for p, s in zip(candidates[order], similarity[order])]
+
+    def save(self, path=_default_path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path + '.tmp', 'wb') as f:
+            pickle.dump((self._version, self.__dict__), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(path + '.tmp', path)
+
+    @classmethod
+    def load(cls, path=_default_path):
+        with open(path, 'rb') as f:
+            version, state = pickle.load(f)
+        if version != cls._version:
+            raise ValueError(f'title index at {path} has version {version}, expected {cls._version}')
+        index = cls()
+        index.__dict__.update(state)
+        return index
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __repr__(self):
+        return f'Instance of TitleIndex class, titles={len(self)}, trigrams={len(self.postings)}, source={self.source}'
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+def _load_or_build(key, path, source_version, build):
+    '''
+        :source_version: value identifying the current state of the source data; when it changes, the index kept in
+            memory and the one saved at path are stale and the index is rebuilt
+    '''
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None or index.source_version != source_version:
+            try:
+                index = TitleIndex.load(path)
+                if index.source_version != source_version:
+                    raise ValueError(f'title index at {path} was built from other data')
+            except (OSError, ValueError, pickle.UnpicklingError):
+                index = build()
+                index.source_version = source_version
+                index.save(path)
+            _indexes[key] = index
+    return index
+
+def get_title_index(from_year=None, data_dir='data', cache_dir='cache'):
+    '''
+        Returns the process-wide title index over the involved_companies data of a year (or all years),
+        loaded from disk if built from the current data and built (and saved) otherwise.
+    '''
+    key = from_year or 'all'
+    path = os.path.join(cache_dir, f'title_index_{key}.pkl')
+    data_files = [os.path.join(data_dir, f) for f in os.listdir(data_dir) if f.startswith(f'involved_companies_{from_year or ""}')]
+    source_version = max([os.path.getmtime(f) for f in data_files], default=0)
+    return _load_or_build(key, path, source_version, lambda: TitleIndex.from_involved_companies(from_year, data_dir))
+
+def get_mirror_title_index(mirror, cache_dir='cache'):
+    '''
+        Returns the process-wide title index over the games of an igdb_mirror.IGDBMirror, loaded or built like get_title_index.
+        It is rebuilt when a games sync of the mirror completes (file times are no use, as the mirror writes to its WAL file).
+    '''
+    path = os.path.join(cache_dir, 'title_index_mirror.pkl')
+    source_version = (mirror.path, mirror.sync_completed_at('games'))
+    return _load_or_build(mirror.path, path, source_version, lambda: TitleIndex.from_mirror(mirror))
@@ -0,0 +1,55 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from http_session import get_session
+from igdb_cache import get_default_cache, day
+
+#oEmbed answers with a small json document for embeddable videos and 401/404 otherwise, unlike the watch page
+_probe_url = 'https://www.youtube.com/oembed'
+_namespace = 'youtube_video'
+video_ttl = 7*day
+probe_timeout = 2
+
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='video_validation')
+_pending = set()
+_pending_lock = threading.Lock()
+
+def probe_video(video_id:str, session=None, timeout=probe_timeout):
+    '''
+        returns True if the YouTube video can be embedded, False if not, None if YouTube could not be reached
+    '''
+    session = get_session() if session is None else session
+    params = {'format': 'json', 'url': f'https://www.youtube.com/watch?v={video_id}'}
+    try:
+        response = session.get(_probe_url, params=params, timeout=timeout)
+    except requests.exceptions.RequestException as e:
+        print('Error in request:', e)
+        return None
+    return response.status_code == 200
+
+def _validate(video_id, session, cache):
+    try:
+        valid = probe_video(video_id, session)
+        if valid is not None:
+            cache.set(_namespace, video_id, valid, video_ttl)
+    finally:
+        with _pending_lock:
+            _pending.discard(video_id)
+
+def validate_video(video_id:str, session=None, cache=None):
+    '''
+        Non-blocking validation of a YouTube video id.
+
+        returns the cached result (True/False) if the video has been validated within the time to live,
+        otherwise schedules a background probe and returns None
+    '''
+    cache = get_default_cache() if cache is None else cache
+    hit, valid = cache.get(_namespace, video_id)
+    if hit:
+        return valid
+    with _pending_lock:
+        if video_id in _pending:
+            return None
+        _pending.add(video_id)
+    _executor.submit(_validate, video_id, session, cache)
+    return None